@@ -6,6 +6,12 @@ from typing import Optional
 @dataclass
 class ModelConfig:
     embedding_model_name: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    # auto / fp32 / fp16 / bf16 / int8
+    embedding_precision: str = "auto"
+    compile_embedding_model: bool = False
+    # Thread torch untuk encode di CPU: None = default torch, 0 = jumlah core fisik.
+    # Berlaku untuk seluruh proses, termasuk model generator
+    embedding_num_threads: Optional[int] = None
     qa_model_name: str = "Wikidepia/indobert-lite-squad"
     # generative_model_name: str = "IzzulGod/GPT2-Indo-Instruct-Tuned"
     generative_model_name: str = "cahya/gpt2-small-indonesian-522M"
@@ -17,7 +23,20 @@ class ModelConfig:
 class DataConfig:
     chunk_size: int = 500
     chunk_overlap: int = 50
+    align_sentences: bool = False
     batch_size: int = 32
+    # None = os.cpu_count() * 4, 1 = baca file secara serial (HDD)
+    max_workers: Optional[int] = None
+    # None = os.cpu_count() - 1 proses untuk splitting, 1 = serial
+    num_workers: Optional[int] = None
+    # Jumlah embedding query yang disimpan Retriever (0 = tanpa cache)
+    query_cache_size: int = 1024
+    # Profil pencarian HNSW: fast / balanced / recall; ef_search mengganti ef profil.
+    # ef disimpan Chroma di koleksi, bukan per query
+    search_profile: str = "balanced"
+    ef_search: Optional[int] = None
+    # Cache embedding on-disk agar build_index hanya meng-encode chunk baru
+    use_embedding_cache: bool = True
 
 @dataclass
 class LoggingConfig:
@@ -33,5 +52,8 @@ class Settings:
         
     def get_vector_db_path(self) -> str:
         return "data/processed/vector_db"
+    
+    def get_embedding_cache_path(self) -> str:
+        return "data/processed/embedding_cache.sqlite3"
 
 settings = Settings()
@@ -1,21 +1,84 @@
+import mmap
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from abc import ABC, abstractmethod
 import pandas as pd
 
 from src.utils.logger import app_logger
 from src.utils.progress_bar import ProgressBar
 
+# File di atas ukuran ini dibaca lewat mmap
+MMAP_THRESHOLD = 4 * 1024 * 1024
+
 class BaseDataLoader(ABC):
     @abstractmethod
     def load_data(self, source: str) -> List[Dict[str, Any]]:
         pass
 
 class IndonesianTextLoader(BaseDataLoader):
-    def __init__(self, use_tqdm: bool = True):
+    def __init__(self, use_tqdm: bool = True, max_workers: Optional[int] = None):
         self.use_tqdm = use_tqdm
-        app_logger.info("IndonesianTextLoader initialized")
+        # max_workers=1 memaksa pembacaan serial (berguna untuk HDD)
+        self.max_workers = max_workers or (os.cpu_count() or 1) * 4
+        # Buffer baca per thread, dipakai ulang antar file
+        self._local = threading.local()
+        app_logger.info(f"IndonesianTextLoader initialized with max_workers={self.max_workers}")
+    
+    def _get_buffer(self, size: int) -> bytearray:
+        """Ambil buffer milik thread ini, perbesar jika belum cukup"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or len(buffer) < size:
+            buffer = bytearray(size)
+            self._local.buffer = buffer
+        return buffer
+    
+    def _read_text(self, file_path: Path) -> str:
+        """Baca seluruh file dengan satu buffer berukuran st_size lalu decode sekali"""
+        fd = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            size = os.fstat(fd).st_size
+            if size >= MMAP_THRESHOLD:
+                # File besar di-decode langsung dari page cache, tanpa buffer per thread
+                with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+                    content = str(mm, 'utf-8')
+            else:
+                content = self._read_buffered(fd, size)
+        finally:
+            os.close(fd)
+        
+        # Samakan dengan mode teks: normalisasi newline Windows
+        if '\r' in content:
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+        return content
+    
+    def _read_buffered(self, fd: int, size: int) -> str:
+        view = memoryview(self._get_buffer(size))
+        read = 0
+        while read < size:
+            if hasattr(os, 'readv'):
+                n = os.readv(fd, [view[read:size]])
+            else:
+                chunk = os.read(fd, size - read)
+                n = len(chunk)
+                view[read:read + n] = chunk
+            if n == 0:
+                break
+            read += n
+        return str(view[:read], 'utf-8')
+    
+    def _read_one(self, file_path: Path) -> Dict[str, Any]:
+        """Baca satu file teks dan kembalikan sebagai dokumen"""
+        content = self._read_text(file_path)
+        
+        return {
+            'content': content,
+            'source': str(file_path),
+            'language': 'indonesian',
+            'file_size': len(content)
+        }
     
     def load_from_directory(self, directory_path: str) -> List[Dict[str, Any]]:
         directory = Path(directory_path)
@@ -34,27 +97,45 @@ class IndonesianTextLoader(BaseDataLoader):
             use_tqdm=self.use_tqdm
         )
         
-        for file_path in text_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    content = file.read()
-                    
-                    documents.append({
-                        'content': content,
-                        'source': str(file_path),
-                        'language': 'indonesian',
-                        'file_size': len(content)
-                    })
-                    
-                progress_bar.update(1, postfix={"current_file": file_path.name})
+        # Simpan hasil per indeks agar urutan dokumen tetap sama dengan urutan file
+        results: List[Optional[Dict[str, Any]]] = [None] * len(text_files)
+        
+        if self.max_workers <= 1:
+            for i, file_path in enumerate(text_files):
+                results[i] = self._load_file(file_path, progress_bar)
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {
+                    executor.submit(self._read_one, file_path): i
+                    for i, file_path in enumerate(text_files)
+                }
                 
-            except Exception as e:
-                app_logger.error(f"Error loading file {file_path}: {str(e)}")
-                progress_bar.update(1)
+                for future in as_completed(futures):
+                    i = futures[future]
+                    file_path = text_files[i]
+                    try:
+                        results[i] = future.result()
+                        progress_bar.update(1, postfix={"current_file": file_path.name})
+                    except Exception as e:
+                        app_logger.error(f"Error loading file {file_path}: {str(e)}")
+                        progress_bar.update(1)
+        
+        documents = [doc for doc in results if doc is not None]
         
         progress_bar.close()
         app_logger.info(f"Successfully loaded {len(documents)} documents")
         return documents
     
+    def _load_file(self, file_path: Path, progress_bar: ProgressBar) -> Optional[Dict[str, Any]]:
+        """Pembacaan serial satu file dengan penanganan error"""
+        try:
+            document = self._read_one(file_path)
+            progress_bar.update(1, postfix={"current_file": file_path.name})
+            return document
+        except Exception as e:
+            app_logger.error(f"Error loading file {file_path}: {str(e)}")
+            progress_bar.update(1)
+            return None
+    
     def load_data(self, source: str) -> List[Dict[str, Any]]:
-        return self.load_from_directory(source)
\ No newline at end of file
+        return self.load_from_directory(source)
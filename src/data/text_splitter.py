@@ -1,48 +1,99 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
+from dataclasses import dataclass
+from functools import partial
+from operator import itemgetter
+import bisect
+import multiprocessing
+import os
 import re
+import sys
+import numpy as np
 from src.utils.logger import app_logger
 from src.utils.progress_bar import ProgressBar
 
+# Pattern untuk memisahkan kalimat dalam bahasa Indonesia
+_SENT_RE = re.compile(r'[.!?।]+|\n\n')
+_SENT_END_CHARS = frozenset('.!?।')
+
+# Di bawah jumlah dokumen ini biaya start-up proses lebih mahal dari splitting
+_MIN_DOCS_FOR_POOL = 5
+# Batas atas dokumen per task yang dikirim ke worker
+_MAX_POOL_CHUNKSIZE = 16
+# Pool dibuat dari thread pipeline build_index saat torch sudah aktif; fork dari
+# proses multithread bisa deadlock, jadi worker dimulai dari proses bersih
+_POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
 class IndonesianTextSplitter:
-    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50, use_tqdm: bool = True):
+    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50, use_tqdm: bool = True,
+                 num_workers: Optional[int] = None, align_sentences: bool = False):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.use_tqdm = use_tqdm
+        self.num_workers = num_workers or max(1, (os.cpu_count() or 1) - 1)
+        # Jika True, awal window digeser ke awal kalimat terdekat
+        self.align_sentences = align_sentences
         app_logger.info(f"TextSplitter initialized with chunk_size={chunk_size}, overlap={chunk_overlap}")
     
     def split_sentences(self, text: str) -> List[str]:
-        # Pattern untuk memisahkan kalimat dalam bahasa Indonesia
-        sentence_endings = r'[.!?।]+|\n\n'
-        sentences = re.split(sentence_endings, text)
+        sentences = _SENT_RE.split(text)
         return [s.strip() for s in sentences if s.strip()]
     
-    def create_chunks(self, sentences: List[str]) -> List[str]:
-        chunks = []
-        current_chunk = []
-        current_length = 0
+    def create_chunks(self, text: str) -> List[str]:
+        """Sliding window sebesar chunk_size kata dengan stride chunk_size - chunk_overlap"""
+        tokens = text.split()
+        if not tokens:
+            return []
         
-        for sentence in sentences:
-            sentence_length = len(sentence.split())
-            
-            if current_length + sentence_length > self.chunk_size and current_chunk:
-                chunks.append(" ".join(current_chunk))
-                
-                # Keep overlap for context preservation
-                overlap_start = max(0, len(current_chunk) - self.chunk_overlap)
-                current_chunk = current_chunk[overlap_start:]
-                current_length = sum(len(s.split()) for s in current_chunk)
-            
-            current_chunk.append(sentence)
-            current_length += sentence_length
+        window = self.chunk_size
+        stride = max(1, self.chunk_size - self.chunk_overlap)
+        sentence_starts = self._sentence_starts(tokens) if self.align_sentences else None
         
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
+        chunks = []
+        start = 0
+        while True:
+            end = start + window
+            chunks.append(" ".join(tokens[start:end]))
+            if end >= len(tokens):
+                break
+            
+            next_start = start + stride
+            if sentence_starts:
+                next_start = self._snap_to_sentence(next_start, start, end, stride, sentence_starts)
+            start = next_start
         
         return chunks
     
-    def split_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        app_logger.info(f"Splitting {len(documents)} documents into chunks")
-        all_chunks = []
+    def _sentence_starts(self, tokens: List[str]) -> List[int]:
+        """Indeks token yang mengawali kalimat (token sebelumnya diakhiri tanda baca)"""
+        return [i for i in range(1, len(tokens)) if tokens[i - 1][-1] in _SENT_END_CHARS]
+    
+    def _snap_to_sentence(self, position: int, start: int, end: int, stride: int,
+                          sentence_starts: List[int]) -> int:
+        """Geser awal window ke awal kalimat terdekat tanpa membuat celah antar chunk"""
+        idx = bisect.bisect_left(sentence_starts, position)
+        candidates = [
+            b for b in sentence_starts[max(0, idx - 1):idx + 1]
+            if start < b <= end and abs(b - position) <= stride // 2
+        ]
+        if not candidates:
+            return position
+        return min(candidates, key=lambda b: abs(b - position))
+    
+    def _split_document(self, doc: Dict[str, Any]) -> List[str]:
+        return self.create_chunks(doc['content'])
+    
+    def split_documents(self, documents: List[Dict[str, Any]]) -> "ChunkBatch":
+        app_logger.info("Splitting %d documents into chunks", len(documents))
+        
+        chunk_batch = next(self.iter_chunk_batches(documents), None) or _build_batch(_new_columns())
+        app_logger.info("Created %d chunks from %d documents", len(chunk_batch), len(documents))
+        return chunk_batch
+    
+    def iter_chunk_batches(self, documents: List[Dict[str, Any]],
+                           batch_size: Optional[int] = None) -> Iterator["ChunkBatch"]:
+        """Yield ChunkBatch berisi >= batch_size chunk selagi splitting berjalan (None = satu batch)"""
+        columns = _new_columns()
+        chunks_created = 0
         
         progress_bar = ProgressBar(
             total=len(documents), 
@@ -50,31 +101,118 @@ class IndonesianTextSplitter:
             use_tqdm=self.use_tqdm
         )
         
-        for doc in documents:
-            try:
-                sentences = self.split_sentences(doc['content'])
-                chunks = self.create_chunks(sentences)
-                
-                for i, chunk in enumerate(chunks):
-                    chunk_doc = {
-                        'content': chunk,
-                        'source': doc['source'],
-                        'chunk_id': i,
-                        'total_chunks': len(chunks),
-                        'language': 'indonesian',
-                        'original_doc_size': len(doc['content'])
-                    }
-                    all_chunks.append(chunk_doc)
+        try:
+            for source, chunks, doc_size, error in self._iter_split_results(documents):
+                if error is not None:
+                    app_logger.error(f"Error splitting document {source}: {error}")
+                    progress_bar.update(1)
+                    continue
                 
+                n = len(chunks)
+                columns['contents'].extend(chunks)
+                columns['sources'].extend([source] * n)
+                columns['doc_chunk_counts'].append(n)
+                columns['doc_sizes'].append(doc_size)
+                chunks_created += n
                 progress_bar.update(1, postfix={
                     "original_docs": len(documents),
-                    "chunks_created": len(all_chunks)
+                    "chunks_created": chunks_created
                 })
                 
-            except Exception as e:
-                app_logger.error(f"Error splitting document {doc.get('source', 'unknown')}: {str(e)}")
-                progress_bar.update(1)
+                if batch_size is not None and len(columns['contents']) >= batch_size:
+                    yield _build_batch(columns)
+                    columns = _new_columns()
+        finally:
+            progress_bar.close()
+        
+        if columns['contents']:
+            yield _build_batch(columns)
+    
+    def _iter_split_results(self, documents: List[Dict[str, Any]]):
+        """Hasil _split_one per dokumen, urut sesuai documents"""
+        # Pool hanya sepadan untuk korpus yang cukup besar
+        if self.num_workers > 1 and len(documents) >= _MIN_DOCS_FOR_POOL:
+            # chunksize kecil untuk korpus kecil agar semua worker kebagian dokumen
+            chunksize = max(1, min(_MAX_POOL_CHUNKSIZE, len(documents) // (self.num_workers * 4)))
+            context = multiprocessing.get_context(_POOL_START_METHOD)
+            with context.Pool(self.num_workers, initializer=_init_worker) as pool:
+                yield from pool.imap(partial(_split_one, self), documents, chunksize=chunksize)
+        else:
+            yield from (_split_one(self, doc) for doc in documents)
+
+def _new_columns() -> Dict[str, list]:
+    # Kolom-kolom hasil (struct of arrays), bukan satu dict per chunk.
+    # Kolom numerik disimpan per dokumen lalu diekspansi sekali dengan numpy.
+    return {
+        'contents': [],
+        'sources': [],
+        'doc_chunk_counts': [],
+        'doc_sizes': []
+    }
+
+def _build_batch(columns: Dict[str, list]) -> "ChunkBatch":
+    counts = np.asarray(columns['doc_chunk_counts'], dtype=np.int64)
+    doc_starts = np.cumsum(counts) - counts
+    return ChunkBatch(
+        contents=columns['contents'],
+        sources=columns['sources'],
+        chunk_ids=np.arange(len(columns['contents']), dtype=np.int64) - np.repeat(doc_starts, counts),
+        total_chunks=np.repeat(counts, counts),
+        original_doc_size=np.repeat(np.asarray(columns['doc_sizes'], dtype=np.int64), counts)
+    )
+
+@dataclass
+class ChunkBatch:
+    """Hasil splitting dalam layout kolom; baris ke-i membentuk satu chunk"""
+    contents: List[str]
+    sources: List[str]
+    chunk_ids: np.ndarray
+    total_chunks: np.ndarray
+    original_doc_size: np.ndarray
+    language: str = 'indonesian'
+    
+    def __len__(self) -> int:
+        return len(self.contents)
+    
+    @classmethod
+    def from_documents(cls, documents: List[Dict[str, Any]]) -> "ChunkBatch":
+        """Bangun ChunkBatch dari list dict chunk (format lama)
         
-        progress_bar.close()
-        app_logger.info(f"Created {len(all_chunks)} chunks from {len(documents)} documents")
-        return all_chunks
\ No newline at end of file
+        Chunk tanpa chunk_id diberi nomor urut kemunculannya per source, agar ID
+        stabilnya tidak bertabrakan dengan chunk lain dari source yang sama.
+        """
+        sources = [doc.get('source', 'unknown') for doc in documents]
+        next_chunk_id: Dict[str, int] = {}
+        chunk_ids = []
+        for source, doc in zip(sources, documents):
+            chunk_id = doc.get('chunk_id')
+            if chunk_id is None:
+                chunk_id = next_chunk_id.get(source, 0)
+            next_chunk_id[source] = chunk_id + 1
+            chunk_ids.append(chunk_id)
+        return cls(
+            contents=list(map(itemgetter('content'), documents)),
+            sources=sources,
+            chunk_ids=np.asarray(chunk_ids, dtype=np.int64),
+            total_chunks=np.asarray([doc.get('total_chunks', 1) for doc in documents], dtype=np.int64),
+            original_doc_size=np.asarray(
+                [doc.get('original_doc_size', len(doc['content'])) for doc in documents], dtype=np.int64
+            ),
+            language=documents[0].get('language', 'indonesian') if documents else 'indonesian'
+        )
+
+def _init_worker():
+    """Worker splitting tidak memakai torch/BLAS; batasi ke satu thread agar tidak berebut CPU"""
+    os.environ["OMP_NUM_THREADS"] = "1"
+    os.environ["MKL_NUM_THREADS"] = "1"
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(1)
+
+def _split_one(splitter: IndonesianTextSplitter, doc: Dict[str, Any]):
+    """Worker top-level (picklable) untuk memecah satu dokumen"""
+    source = doc.get('source', 'unknown')
+    try:
+        return source, splitter._split_document(doc), len(doc['content']), None
+    except Exception as e:
+        return source, [], 0, str(e)
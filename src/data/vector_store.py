@@ -1,26 +1,82 @@
-import chromadb
-from chromadb.config import Settings
 import numpy as np
-from typing import List, Dict, Any, Optional
-import uuid
+from typing import List, Dict, Any, Optional, Union
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import logging
 import os
+import time
 
 from src.utils.logger import app_logger
 from src.utils.progress_bar import ProgressBar
+from src.data.text_splitter import ChunkBatch
+
+def _chroma_accepts_ndarray() -> bool:
+    """Chroma >= 0.5 menerima np.ndarray langsung untuk embeddings"""
+    import chromadb
+    
+    try:
+        major, minor = (int(part) for part in chromadb.__version__.split(".")[:2])
+        return (major, minor) >= (0, 5)
+    except (AttributeError, ValueError):
+        return False
+
+# Ukuran batch insert yang direkomendasikan untuk ChromaDB
+ADD_BATCH_SIZE = 256
+# Thread penulis dan batas batch yang boleh antre sekaligus
+ADD_WORKERS = 2
+ADD_MAX_IN_FLIGHT = 3
+
+# Penanda koleksi yang dibuat dengan layout saat ini (space ip, ID dari _stable_id)
+COLLECTION_LAYOUT = "ip-stable-id"
+
+# Metadata koleksi: parameter hnsw:* hanya berlaku saat koleksi pertama kali dibuat
+COLLECTION_METADATA = {
+    "description": "Indonesian documents for RAG system",
+    "layout": COLLECTION_LAYOUT,
+    # Embedding sudah dinormalisasi L2, sehingga inner product setara cosine
+    "hnsw:space": "ip",
+    "hnsw:construction_ef": 200,
+    "hnsw:M": 32
+}
+
+# Parameter HNSW untuk first-load: vektor ditampung lalu dimasukkan ke
+# index HNSW dalam satu panggilan add_items besar, bukan per 100 vektor
+BULK_HNSW_BATCH_SIZE = 10000
+BULK_HNSW_SYNC_THRESHOLD = 50000
+
+# Lama (detik) hasil collection.count() disimpan
+COUNT_CACHE_TTL = 5.0
+
+def _stable_id(source: str, chunk_id: int) -> str:
+    """ID deterministik dari source + chunk_id sehingga re-ingest tidak menduplikasi vektor"""
+    key = f"{source}|{chunk_id}"
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
 
 class VectorStore:
     def __init__(self, persist_directory: str = "data/processed/vector_db", use_tqdm: bool = True):
         self.persist_directory = persist_directory
         self.use_tqdm = use_tqdm
+        self._count_cache = None
+        self.search_ef = None
         
         # Buat direktori jika belum ada
         os.makedirs(persist_directory, exist_ok=True)
         
+        # chromadb di-import di sini agar modul ini ringan untuk di-import
+        import chromadb
+        
         self.client = chromadb.PersistentClient(path=persist_directory)
+        self._accepts_ndarray = _chroma_accepts_ndarray()
         
         # Inisialisasi koleksi - gunakan get_or_create_collection
         self._ensure_collection_initialized()
+        if not self.has_current_layout():
+            app_logger.warning(
+                "Vector store collection was built with an older layout (distance space or ids); "
+                "rebuild it with --data-dir and --recreate-outdated"
+            )
         
         app_logger.info(f"Vector store initialized at {persist_directory}")
     
@@ -30,7 +86,7 @@ class VectorStore:
             # Gunakan get_or_create_collection untuk menghindari error
             self.collection = self.client.get_or_create_collection(
                 name="indonesian_documents",
-                metadata={"description": "Indonesian documents for RAG system"}
+                metadata=COLLECTION_METADATA
             )
             app_logger.info("Collection ensured and ready")
         except Exception as e:
@@ -57,14 +113,58 @@ class VectorStore:
             app_logger.error(f"Fallback collection creation also failed: {str(e)}")
             raise
     
+    def has_current_layout(self) -> bool:
+        """True jika koleksi memakai space inner product dan ID stabil dari _stable_id"""
+        try:
+            # Chroma lama bisa kehilangan hnsw:space dari metadata setelah modify,
+            # jadi koleksi bertanda layout tidak dinilai dari space-nya
+            if (self.collection.metadata or {}).get("layout") == COLLECTION_LAYOUT:
+                return True
+            
+            # Koleksi tanpa penanda: Chroma memakai l2 jika hnsw:space tidak diset
+            space = self._hnsw_setting('space', 'hnsw:space') or 'l2'
+            if space != COLLECTION_METADATA["hnsw:space"]:
+                return False
+            
+            sample = self.collection.get(limit=1, include=["metadatas"])
+            if not sample['ids']:
+                return True
+            metadata = (sample['metadatas'] or [None])[0] or {}
+            return sample['ids'][0] == _stable_id(metadata.get('source', 'unknown'), metadata.get('chunk_id', 0))
+        except Exception as e:
+            app_logger.error(f"Error checking collection layout: {str(e)}")
+            return True
+    
+    def recreate_if_outdated(self) -> bool:
+        """Hapus koleksi berlayout lama (vektor l2 tanpa normalisasi / ID uuid) agar dibangun ulang"""
+        if self.has_current_layout():
+            return False
+        
+        app_logger.warning("Recreating vector store collection with the current layout")
+        self._count_cache = None
+        self.client.delete_collection("indonesian_documents")
+        self.collection = self.client.create_collection(
+            name="indonesian_documents",
+            metadata=COLLECTION_METADATA
+        )
+        if self.search_ef is not None:
+            self.set_search_ef(self.search_ef)
+        return True
+    
     def collection_exists(self, collection_name: str = "indonesian_documents") -> bool:
         """Check if collection exists in vector database"""
+        # Koleksi sudah di-cache oleh _ensure_collection_initialized
+        collection = getattr(self, 'collection', None)
+        if collection is not None and collection.name == collection_name:
+            return True
+        
         try:
             collections = self.client.list_collections()
-            collection_names = [col.name for col in collections]
+            # Sebagian versi Chroma mengembalikan nama, sebagian objek Collection
+            collection_names = [getattr(col, 'name', col) for col in collections]
             exists = collection_name in collection_names
             
-            if exists and not hasattr(self, 'collection'):
+            if exists and collection is None:
                 # Jika koleksi ada tapi belum di-set di instance ini
                 self.collection = self.client.get_collection(collection_name)
             
@@ -79,32 +179,139 @@ class VectorStore:
             if not hasattr(self, 'collection') or self.collection is None:
                 self._ensure_collection_initialized()
             
-            return self.collection.count()
+            # Pemanggil sering polling count; simpan hasilnya selama COUNT_CACHE_TTL detik
+            now = time.monotonic()
+            if self._count_cache is not None and now - self._count_cache[1] < COUNT_CACHE_TTL:
+                return self._count_cache[0]
+            
+            count = self.collection.count()
+            self._count_cache = (count, now)
+            return count
         except Exception as e:
             app_logger.error(f"Error getting collection count: {str(e)}")
             return 0
 
-    def add_documents(self, documents: List[Dict[str, Any]], embeddings: np.ndarray):
-        """Add documents to vector store - versi yang diperbaiki"""
+    def bulk_build(self, documents: Union[ChunkBatch, List[Dict[str, Any]]], embeddings: np.ndarray):
+        """Initial load ke koleksi kosong dengan batch HNSW besar dan insert per max batch"""
+        if not self.begin_bulk_load():
+            app_logger.info("Collection is not empty, falling back to incremental add")
+            self.add_documents(documents, embeddings)
+            return
+        
+        self.add_bulk(documents, embeddings)
+    
+    def begin_bulk_load(self) -> bool:
+        """Siapkan koleksi kosong untuk first-load; False jika koleksi sudah berisi
+        
+        Setelah True, seluruh korpus (boleh bertahap) ditambahkan dengan add_bulk.
+        """
+        if not hasattr(self, 'collection') or self.collection is None:
+            self._ensure_collection_initialized()
+        
+        # Koleksi hanya dihapus jika count langsung (bukan cache, error tidak ditelan) = 0
+        if self.collection.count() > 0:
+            return False
+        
+        app_logger.info("Bulk building collection")
+        
+        # Parameter hnsw:* hanya bisa diset saat koleksi dibuat
+        self._count_cache = None
+        self.client.delete_collection("indonesian_documents")
+        self.collection = self.client.create_collection(
+            name="indonesian_documents",
+            metadata={
+                **COLLECTION_METADATA,
+                "hnsw:batch_size": BULK_HNSW_BATCH_SIZE,
+                "hnsw:sync_threshold": BULK_HNSW_SYNC_THRESHOLD
+            }
+        )
+        
+        if self.search_ef is not None:
+            self.set_search_ef(self.search_ef)
+        return True
+    
+    def add_bulk(self, documents: Union[ChunkBatch, List[Dict[str, Any]]], embeddings: np.ndarray):
+        """Tambah chunk ke koleksi yang disiapkan begin_bulk_load: per max batch, tanpa pruning"""
+        # Koleksi baru kosong, jadi tidak ada chunk lama yang perlu dihapus
+        self.add_documents(documents, embeddings, batch_size=self.max_batch_size(), prune_stale=False)
+    
+    def _hnsw_setting(self, config_key: str, metadata_key: str):
+        """Baca parameter HNSW koleksi: configuration (Chroma >= 1.0) atau metadata (Chroma lama)"""
+        configuration = getattr(self.collection, 'configuration_json', None) or {}
+        hnsw = configuration.get('hnsw') or {}
+        if config_key in hnsw:
+            return hnsw[config_key]
+        return (self.collection.metadata or {}).get(metadata_key)
+    
+    def set_search_ef(self, ef_search: int):
+        """Atur ef HNSW saat query (lebih besar = recall lebih tinggi, lebih lambat)
+        
+        Chroma menyimpan ef sebagai pengaturan koleksi, jadi modify hanya dipanggil
+        jika nilainya berbeda dari yang sudah tersimpan.
+        """
+        self.search_ef = ef_search
         try:
+            if not hasattr(self, 'collection') or self.collection is None:
+                self._ensure_collection_initialized()
+            
+            if self._hnsw_setting('ef_search', 'hnsw:search_ef') == ef_search:
+                return
+            
+            try:
+                # Chroma >= 1.0: parameter HNSW lewat configuration
+                self.collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+            except TypeError:
+                # Chroma lama: lewat metadata; hnsw:space tidak boleh dikirim ulang
+                metadata = {k: v for k, v in (self.collection.metadata or {}).items() if k != "hnsw:space"}
+                metadata["hnsw:search_ef"] = ef_search
+                self.collection.modify(metadata=metadata)
+            
+            app_logger.info(f"HNSW search ef set to {ef_search}")
+        except Exception as e:
+            app_logger.warning(f"Could not set HNSW search ef: {str(e)}")
+    
+    def max_batch_size(self) -> int:
+        """Ukuran batch maksimum yang diterima client Chroma"""
+        try:
+            if hasattr(self.client, 'get_max_batch_size'):
+                return self.client.get_max_batch_size()
+            return self.client.max_batch_size
+        except Exception:
+            return ADD_BATCH_SIZE
+    
+    def add_documents(self, documents: Union[ChunkBatch, List[Dict[str, Any]]], embeddings: np.ndarray,
+                      batch_size: Optional[int] = None, prune_stale: bool = True):
+        """Add documents to vector store - versi yang diperbaiki
+        
+        ID stabil per (source, chunk_id), jadi chunk yang sudah ada ditimpa (upsert).
+        Dengan prune_stale, chunk lama di luar total_chunks baru dari tiap source dihapus;
+        untuk list dict hanya jika setiap chunk membawa total_chunks.
+        """
+        try:
+            if not isinstance(documents, ChunkBatch):
+                prune_stale = prune_stale and all('total_chunks' in doc for doc in documents)
+                documents = ChunkBatch.from_documents(documents)
+            
             # Pastikan collection tersedia
             if not hasattr(self, 'collection') or self.collection is None:
                 self._ensure_collection_initialized()
             
             app_logger.info(f"Adding {len(documents)} documents to vector store")
             
-            ids = [str(uuid.uuid4()) for _ in range(len(documents))]
-            documents_content = [doc['content'] for doc in documents]
-            metadatas = []
+            # Chroma menolak seluruh batch jika ada ID ganda, dan upsert antar batch
+            # akan diam-diam saling menimpa
+            ids = [
+                _stable_id(source, chunk_id)
+                for source, chunk_id in zip(documents.sources, documents.chunk_ids.tolist())
+            ]
+            if len(set(ids)) != len(ids):
+                raise ValueError("Duplicate (source, chunk_id) pairs in documents")
             
-            for doc in documents:
-                metadata = {
-                    'source': doc.get('source', 'unknown'),
-                    'chunk_id': doc.get('chunk_id', 0),
-                    'language': doc.get('language', 'indonesian'),
-                    'timestamp': datetime.now().isoformat()
-                }
-                metadatas.append(metadata)
+            # Satu array kontigu agar slice per batch tidak perlu disalin
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            
+            # Satu timestamp untuk seluruh proses ingest
+            timestamp = datetime.now().isoformat()
             
             progress_bar = ProgressBar(
                 total=len(documents), 
@@ -112,32 +319,50 @@ class VectorStore:
                 use_tqdm=self.use_tqdm
             )
             
-            # Add in batches to avoid memory issues
-            batch_size = 100
-            for i in range(0, len(documents), batch_size):
-                end_idx = min(i + batch_size, len(documents))
-                
-                batch_ids = ids[i:end_idx]
-                batch_embeddings = embeddings[i:end_idx].tolist()
-                batch_documents = documents_content[i:end_idx]
-                batch_metadatas = metadatas[i:end_idx]
-                
-                try:
-                    self.collection.add(
+            # Add in batches to avoid memory issues. Batch berikutnya disiapkan
+            # selagi batch sebelumnya masih ditulis oleh thread pool.
+            batch_size = batch_size or ADD_BATCH_SIZE
+            pending = deque()
+            with ThreadPoolExecutor(max_workers=ADD_WORKERS) as executor:
+                for i in range(0, len(documents), batch_size):
+                    end_idx = min(i + batch_size, len(documents))
+                    
+                    batch_sources = documents.sources[i:end_idx]
+                    batch_chunk_ids = documents.chunk_ids[i:end_idx].tolist()
+                    batch_ids = ids[i:end_idx]
+                    batch_embeddings = embeddings[i:end_idx]
+                    if not self._accepts_ndarray:
+                        batch_embeddings = batch_embeddings.tolist()
+                    batch_documents = documents.contents[i:end_idx]
+                    batch_metadatas = [
+                        {
+                            'source': source,
+                            'chunk_id': chunk_id,
+                            'language': documents.language,
+                            'timestamp': timestamp
+                        }
+                        for source, chunk_id in zip(batch_sources, batch_chunk_ids)
+                    ]
+                    
+                    future = executor.submit(
+                        self.collection.upsert,
                         ids=batch_ids,
                         embeddings=batch_embeddings,
                         documents=batch_documents,
                         metadatas=batch_metadatas
                     )
+                    pending.append((i // batch_size, end_idx, len(batch_ids), future))
                     
-                    progress_bar.update(len(batch_ids), postfix={
-                        "added": end_idx,
-                        "total": len(documents)
-                    })
-                    
-                except Exception as e:
-                    app_logger.error(f"Error adding batch {i//batch_size}: {str(e)}")
-                    progress_bar.update(len(batch_ids))
+                    # Batasi jumlah batch yang sedang ditulis
+                    if len(pending) >= ADD_MAX_IN_FLIGHT:
+                        self._finish_batch(pending.popleft(), progress_bar, len(documents))
+                
+                while pending:
+                    self._finish_batch(pending.popleft(), progress_bar, len(documents))
+            
+            if prune_stale:
+                self._delete_stale_chunks(documents)
+            self._count_cache = None
             
             progress_bar.close()
             app_logger.info(f"Successfully added {len(documents)} documents to vector store")
@@ -146,30 +371,70 @@ class VectorStore:
             app_logger.error(f"Error in add_documents: {str(e)}")
             raise
     
-    def search(self, query_embedding: List[float], n_results: int = 5) -> List[Dict[str, Any]]:
+    def _delete_stale_chunks(self, documents: ChunkBatch):
+        """Hapus chunk sisa dari versi dokumen yang lebih panjang (chunk_id >= total_chunks baru)"""
+        totals = dict(zip(documents.sources, documents.total_chunks.tolist()))
+        for source, total in totals.items():
+            try:
+                self.collection.delete(where={
+                    "$and": [{"source": {"$eq": source}}, {"chunk_id": {"$gte": total}}]
+                })
+            except Exception as e:
+                app_logger.error(f"Error deleting stale chunks of {source}: {str(e)}")
+    
+    def _finish_batch(self, batch, progress_bar: ProgressBar, total: int):
+        """Tunggu satu batch selesai ditulis lalu perbarui progress"""
+        batch_index, end_idx, batch_len, future = batch
+        try:
+            future.result()
+            progress_bar.update(batch_len, postfix={
+                "added": end_idx,
+                "total": total
+            })
+        except Exception as e:
+            app_logger.error(f"Error adding batch {batch_index}: {str(e)}")
+            progress_bar.update(batch_len)
+    
+    def search(self, query_embedding: Union[np.ndarray, List[float]], n_results: int = 5) -> List[Dict[str, Any]]:
         """Search in vector store"""
+        query_embeddings = np.asarray(query_embedding, dtype=np.float32)[None, :]
+        return self.search_batch(query_embeddings, n_results=n_results)[0]
+    
+    def search_batch(self, query_embeddings: Union[np.ndarray, List[List[float]]],
+                     n_results: int = 5) -> List[List[Dict[str, Any]]]:
+        """Search banyak query sekaligus dalam satu panggilan collection.query"""
         try:
             # Pastikan collection tersedia
             if not hasattr(self, 'collection') or self.collection is None:
                 self._ensure_collection_initialized()
             
+            # ndarray float32 kontigu langsung ke Chroma, tanpa boxing ke list Python
+            query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+            if not self._accepts_ndarray:
+                query_embeddings = query_embeddings.tolist()
+            
             results = self.collection.query(
-                query_embeddings=[query_embedding],
+                query_embeddings=query_embeddings,
                 n_results=n_results
             )
             
-            formatted_results = []
-            if results['documents'] and len(results['documents']) > 0:
-                for i in range(len(results['documents'][0])):
-                    formatted_results.append({
-                        'content': results['documents'][0][i],
-                        'metadata': results['metadatas'][0][i] if results['metadatas'] else {},
-                        'distance': results['distances'][0][i] if results['distances'] else None
-                    })
+            batch_results = []
+            for q in range(len(query_embeddings)):
+                formatted_results = []
+                if results['documents'] and len(results['documents']) > q:
+                    for i in range(len(results['documents'][q])):
+                        formatted_results.append({
+                            'content': results['documents'][q][i],
+                            'metadata': results['metadatas'][q][i] if results['metadatas'] else {},
+                            'distance': results['distances'][q][i] if results['distances'] else None
+                        })
+                batch_results.append(formatted_results)
             
-            app_logger.info(f"Retrieved {len(formatted_results)} results from vector store")
-            return formatted_results
+            if app_logger.isEnabledFor(logging.INFO):
+                app_logger.info("Retrieved %d results from vector store for %d queries",
+                                sum(len(r) for r in batch_results), len(query_embeddings))
+            return batch_results
             
         except Exception as e:
             app_logger.error(f"Error searching vector store: {str(e)}")
-            return []
\ No newline at end of file
+            return [[] for _ in query_embeddings]
@@ -1,32 +1,77 @@
-from transformers import (
-    AutoTokenizer, 
-    AutoModelForQuestionAnswering,
-    AutoModelForCausalLM,
-    pipeline
-)
-from typing import List, Dict, Any
-import torch
+from typing import List, Dict, Any, Set, Tuple
+import functools
+import heapq
+import re
 
 from src.utils.logger import app_logger
 
+# Pemisah kalimat (tanda baca tetap ikut kalimatnya) dan pemisah kata
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+_WORD_RE = re.compile(r'\w+')
+
+def _keywords(text: str, min_length: int = 3) -> Set[str]:
+    """Himpunan kata lowercase dengan panjang minimal min_length"""
+    return {word for word in _WORD_RE.findall(text.lower()) if len(word) >= min_length}
+
+def _with_period(text: str) -> str:
+    return text if text.rstrip().endswith(('.', '!', '?')) else text + "."
+
+# Panjang input maksimum model dan token cadangan untuk special token / pemisah
+QA_MAX_LENGTH = 512
+QA_OVERHEAD_TOKENS = 16
+# Window model generative dibagi antara prompt dan token jawaban yang dihasilkan
+GENERATIVE_MAX_LENGTH = 1024
+GENERATIVE_MAX_NEW_TOKENS = 200
+PROMPT_OVERHEAD_TOKENS = 16
+
+_GENERATIVE_PROMPT = """Anda adalah asisten AI yang membantu menjawab pertanyaan. 
+    Gunakan HANYA informasi dari konteks berikut untuk menjawab pertanyaan.
+
+    KONTEKS:
+    {context}
+
+    PERTANYAAN: {question}
+
+    INSTRUKSI:
+    - Jawab dalam Bahasa Indonesia yang baik dan benar
+    - Berdasarkan hanya pada informasi di konteks
+    - Jika informasi tidak cukup, jelaskan secara singkat
+    - Jangan menambahkan informasi dari luar konteks
+
+    JAWABAN:"""
+
+# Jumlah konten dokumen yang token id-nya disimpan
+TOKEN_CACHE_SIZE = 4096
+
 class IndonesianGenerator:
     def __init__(self, model_config, use_tqdm: bool = True):
+        # Import berat ditunda sampai generator benar-benar dibuat
+        import torch
+        from transformers import (
+            AutoTokenizer, 
+            AutoModelForQuestionAnswering,
+            AutoModelForCausalLM
+        )
+        
         self.model_config = model_config
         self.use_tqdm = use_tqdm
         self.model_type = model_config.model_type
         
+        # Cache token ids per konten dokumen; chunk yang sama sering muncul lagi antar query
+        self._tokenize_doc = functools.lru_cache(maxsize=TOKEN_CACHE_SIZE)(self._tokenize_uncached)
+        
         app_logger.info(f"Loading {self.model_type} model...")
         
         try:
             if self.model_type == "qa":
                 # Load QA model (IndoBERT-lite-squad)
-                self.tokenizer = AutoTokenizer.from_pretrained(model_config.qa_model_name)
+                self.tokenizer = AutoTokenizer.from_pretrained(model_config.qa_model_name, use_fast=True)
                 self.model = AutoModelForQuestionAnswering.from_pretrained(model_config.qa_model_name)
                 app_logger.info(f"Loaded QA model: {model_config.qa_model_name}")
                 
             else:
                 # Load generative model
-                self.tokenizer = AutoTokenizer.from_pretrained(model_config.generative_model_name)
+                self.tokenizer = AutoTokenizer.from_pretrained(model_config.generative_model_name, use_fast=True)
                 self.model = AutoModelForCausalLM.from_pretrained(model_config.generative_model_name)
                 
                 # Tambahkan padding token untuk GPT2
@@ -42,22 +87,41 @@ class IndonesianGenerator:
             # Fallback ke model QA jika generative model gagal
             app_logger.info("Falling back to QA model...")
             self.model_type = "qa"
-            self.tokenizer = AutoTokenizer.from_pretrained(model_config.qa_model_name)
+            self.tokenizer = AutoTokenizer.from_pretrained(model_config.qa_model_name, use_fast=True)
             self.model = AutoModelForQuestionAnswering.from_pretrained(model_config.qa_model_name)
+            self.model.eval()
+        
+        # Pindahkan model ke GPU (fp16) jika tersedia
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model = self.model.to(self.device)
+        if self.device == "cuda":
+            self.model = self.model.half()
+        app_logger.info(f"Generator running on {self.device}")
+    
+    def _autocast(self):
+        """Autocast fp16 hanya aktif di CUDA"""
+        import torch
+        
+        return torch.autocast(self.device, dtype=torch.float16, enabled=self.device == "cuda")
     
     def _generate_comprehensive_answer(self, question: str, context: str) -> str:
         """Fallback method untuk jawaban yang lebih komprehensif"""
         try:
             # Approach alternatif: gunakan chunking yang lebih kecil
-            sentences = context.split('. ')
-            relevant_sentences = []
+            sentences = _SENTENCE_SPLIT_RE.split(context)
+            keywords = _keywords(question)
             
-            for sentence in sentences:
-                if any(keyword in sentence.lower() for keyword in question.lower().split()):
-                    relevant_sentences.append(sentence)
+            scored = [
+                (len(_keywords(sentence) & keywords), i)
+                for i, sentence in enumerate(sentences)
+            ]
+            top = heapq.nlargest(3, (item for item in scored if item[0] > 0),
+                                 key=lambda item: (item[0], -item[1]))
             
-            if relevant_sentences:
-                return ". ".join(relevant_sentences[:3]) + "."
+            if top:
+                # Tampilkan kalimat terpilih sesuai urutan aslinya
+                relevant_sentences = [sentences[i] for _, i in sorted(top, key=lambda item: item[1])]
+                return _with_period(" ".join(relevant_sentences))
             else:
                 return "Informasi yang relevan tidak ditemukan dalam konteks yang diberikan."
                 
@@ -67,34 +131,55 @@ class IndonesianGenerator:
         
     def generate_qa_answer(self, question: str, context: str) -> Dict[str, Any]:
         """Generate answer menggunakan model QA (IndoBERT-lite-squad)"""
+        return self.generate_qa_answer_batch([question], [context])[0]
+    
+    def generate_qa_answer_batch(self, questions: List[str], contexts: List[str]) -> List[Dict[str, Any]]:
+        """Generate answer untuk banyak pasangan (question, context) dalam satu forward pass"""
+        import torch
+        
         try:
             # Tokenize question and context - PERBAIKAN: hilangkan parameter bermasalah
             inputs = self.tokenizer(
-                question, 
-                context, 
+                questions, 
+                contexts, 
                 return_tensors="pt",
                 truncation=True,
-                max_length=512,
+                max_length=QA_MAX_LENGTH,
                 padding=True
                 # HAPUS: stride=128 dan return_overflowing_tokens=True
             )
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
             
-            with torch.no_grad():
+            with torch.inference_mode(), self._autocast():
                 outputs = self.model(**inputs)
-                start_logits = outputs.start_logits
-                end_logits = outputs.end_logits
+                
+                # Token padding tidak boleh terpilih sebagai jawaban
+                padding_mask = inputs["attention_mask"] == 0
+                start_logits = outputs.start_logits.float().masked_fill(padding_mask, float("-inf"))
+                end_logits = outputs.end_logits.float().masked_fill(padding_mask, float("-inf"))
                 
                 # Get the most likely answer span
-                start_idx = torch.argmax(start_logits, dim=1).item()
-                end_idx = torch.argmax(end_logits, dim=1).item() + 1
+                start_max = start_logits.max(dim=1)
+                end_max = end_logits.max(dim=1)
+                start_idx = start_max.indices.tolist()
+                end_idx = (end_max.indices + 1).tolist()
                 
                 # Convert tokens back to text
-                answer_tokens = inputs["input_ids"][0][start_idx:end_idx]
-                answer = self.tokenizer.decode(answer_tokens, skip_special_tokens=True)
+                answer_tokens = [
+                    ids[start:end].tolist()
+                    for ids, start, end in zip(inputs["input_ids"], start_idx, end_idx)
+                ]
+                answers = self.tokenizer.batch_decode(answer_tokens, skip_special_tokens=True)
                 
-                # Calculate confidence score
-                start_score = torch.max(torch.softmax(start_logits, dim=-1)).item()
-                end_score = torch.max(torch.softmax(end_logits, dim=-1)).item()
+                # Calculate confidence score: max softmax = exp(max_logit - logsumexp),
+                # tanpa membentuk seluruh vektor softmax
+                start_scores = torch.exp(start_max.values - torch.logsumexp(start_logits, dim=-1)).tolist()
+                end_scores = torch.exp(end_max.values - torch.logsumexp(end_logits, dim=-1)).tolist()
+            
+            results = []
+            for question, context, answer, start_score, end_score in zip(
+                questions, contexts, answers, start_scores, end_scores
+            ):
                 confidence = (start_score + end_score) / 2
                 
                 # Jika jawaban terlalu pendek atau kosong
@@ -102,25 +187,30 @@ class IndonesianGenerator:
                     answer = self._find_best_sentence_answer(question, context)
                     confidence = confidence * 0.8  # Reduce confidence for fallback
                 
-            return {
-                "answer": answer.strip(),
-                "confidence": confidence,
-                "start_score": start_score,
-                "end_score": end_score
-            }
+                results.append({
+                    "answer": answer.strip(),
+                    "confidence": confidence,
+                    "start_score": start_score,
+                    "end_score": end_score
+                })
+            
+            return results
             
         except Exception as e:
             app_logger.error(f"Error in QA generation: {str(e)}")
-            return {
-                "answer": "Maaf, terjadi kesalahan dalam menghasilkan jawaban.",
-                "confidence": 0.0
-            }
+            return [
+                {
+                    "answer": "Maaf, terjadi kesalahan dalam menghasilkan jawaban.",
+                    "confidence": 0.0
+                }
+                for _ in questions
+            ]
     
     def _find_best_sentence_answer(self, question: str, context: str) -> str:
         """Fallback method untuk mencari jawaban berdasarkan kalimat terbaik"""
         try:
-            sentences = context.split('. ')
-            question_keywords = [word.lower() for word in question.split() if len(word) > 2]
+            sentences = _SENTENCE_SPLIT_RE.split(context)
+            question_keywords = _keywords(question)
             
             best_sentence = ""
             best_score = 0
@@ -129,12 +219,12 @@ class IndonesianGenerator:
                 if len(sentence.strip()) < 10:  # Skip very short sentences
                     continue
                     
-                score = sum(1 for keyword in question_keywords if keyword in sentence.lower())
+                score = len(_keywords(sentence) & question_keywords)
                 if score > best_score:
                     best_score = score
                     best_sentence = sentence
             
-            return best_sentence if best_sentence else sentences[0] + "." if sentences else "Jawaban tidak ditemukan."
+            return best_sentence if best_sentence else _with_period(sentences[0]) if sentences else "Jawaban tidak ditemukan."
             
         except Exception as e:
             app_logger.error(f"Error in best sentence search: {str(e)}")
@@ -142,37 +232,25 @@ class IndonesianGenerator:
     
     def generate_text_answer(self, question: str, context: str) -> Dict[str, Any]:
         """Generate answer menggunakan model generative dengan prompt yang lebih baik"""
+        import torch
+        
         try:
             # Improved prompt dengan instruksi yang lebih jelas
-            prompt = f"""Anda adalah asisten AI yang membantu menjawab pertanyaan. 
-    Gunakan HANYA informasi dari konteks berikut untuk menjawab pertanyaan.
-
-    KONTEKS:
-    {context}
-
-    PERTANYAAN: {question}
-
-    INSTRUKSI:
-    - Jawab dalam Bahasa Indonesia yang baik dan benar
-    - Berdasarkan hanya pada informasi di konteks
-    - Jika informasi tidak cukup, jelaskan secara singkat
-    - Jangan menambahkan informasi dari luar konteks
-
-    JAWABAN:"""
+            prompt = _GENERATIVE_PROMPT.format(context=context, question=question)
             
             # Tokenize input
             inputs = self.tokenizer(
                 prompt, 
                 return_tensors="pt", 
-                max_length=1024, 
+                max_length=GENERATIVE_MAX_LENGTH - GENERATIVE_MAX_NEW_TOKENS, 
                 truncation=True,
                 padding=True
-            )
+            ).to(self.device)
             
-            with torch.no_grad():
+            with torch.inference_mode(), self._autocast():
                 outputs = self.model.generate(
                     inputs.input_ids,
-                    max_length=400,  # Kurangi sedikit untuk fokus yang lebih baik
+                    max_new_tokens=GENERATIVE_MAX_NEW_TOKENS,
                     temperature=0.3,  # Kurangi temperature untuk output lebih deterministik
                     do_sample=True,
                     pad_token_id=self.tokenizer.eos_token_id,
@@ -184,8 +262,10 @@ class IndonesianGenerator:
             # Decode generated text
             generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
             
-            # Extract only the answer part (remove the prompt)
-            answer = generated_text.replace(prompt, "").strip()
+            # Extract only the answer part: token setelah prompt
+            answer = self.tokenizer.decode(
+                outputs[0][inputs.input_ids.shape[1]:], skip_special_tokens=True
+            ).strip()
             
             # Clean up the answer
             if "JAWABAN:" in answer:
@@ -204,12 +284,47 @@ class IndonesianGenerator:
                 "confidence": 0.0
             }
     
+    def _tokenize_uncached(self, content: str) -> Tuple[int, ...]:
+        return tuple(self.tokenizer(content, add_special_tokens=False)['input_ids'])
+    
+    def _build_context(self, query: str, context: List[Dict[str, Any]]) -> str:
+        """Gabungkan konten dokumen sampai budget token input model terpenuhi"""
+        try:
+            if self.model_type == "qa":
+                max_tokens, overhead = QA_MAX_LENGTH, QA_OVERHEAD_TOKENS
+            else:
+                # Sisakan ruang untuk template prompt dan jawaban yang akan di-generate
+                template_tokens = len(self._tokenize_doc(_GENERATIVE_PROMPT.format(context="", question="")))
+                max_tokens = GENERATIVE_MAX_LENGTH - GENERATIVE_MAX_NEW_TOKENS
+                overhead = template_tokens + PROMPT_OVERHEAD_TOKENS
+            
+            question_tokens = len(self._tokenize_uncached(query))
+            remaining = max_tokens - question_tokens - overhead
+            
+            parts = []
+            for doc in context:
+                if remaining <= 0:
+                    break
+                
+                ids = self._tokenize_doc(doc['content'])
+                if len(ids) <= remaining:
+                    parts.append(doc['content'])
+                else:
+                    parts.append(self.tokenizer.decode(list(ids[:remaining]), skip_special_tokens=True))
+                remaining -= len(ids)
+            
+            return "\n\n".join(parts)
+            
+        except Exception as e:
+            app_logger.error(f"Error building context: {str(e)}")
+            return "\n\n".join([doc['content'] for doc in context])
+    
     def generate(self, query: str, context: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Main generation method dengan context dari retrieval"""
         app_logger.info(f"Generating response for query: '{query}'")
         
-        # Combine context from retrieved documents
-        context_text = "\n\n".join([doc['content'] for doc in context])
+        # Combine context from retrieved documents, dibatasi budget token model
+        context_text = self._build_context(query, context)
         
         if not context_text.strip():
             return {
@@ -1,50 +1,142 @@
 import argparse
+import queue
 import sys
+import threading
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import time
+import numpy as np
 
 from src.config.settings import settings
 from src.data.data_loader import IndonesianTextLoader
 from src.data.text_splitter import IndonesianTextSplitter
-from src.models.embedding_model import IndonesianEmbeddingModel
+from src.models.embedding_model import IndonesianEmbeddingModel, l2_normalize
+from src.models.embedding_cache import EmbeddingCache
 from src.data.vector_store import VectorStore
 from src.retrieval.retriever import Retriever
 from src.generation.generator import IndonesianGenerator
 from src.utils.logger import app_logger, setup_logger
 
+# Jumlah chunk per batch yang mengalir di pipeline build_index; batch kecil
+# membuat tahap encode dan simpan mulai lebih awal
+PIPELINE_CHUNK_BATCH = 1024
+PIPELINE_QUEUE_SIZE = 4
+_PIPELINE_END = object()
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """put yang berhenti menunggu jika tahap lain gagal"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _consume(inbox: queue.Queue, work, outbox: Optional[queue.Queue],
+             stop: threading.Event, errors: list):
+    """Loop satu tahap pipeline: ambil item, proses, teruskan hasilnya sampai sentinel"""
+    try:
+        while not stop.is_set():
+            try:
+                item = inbox.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _PIPELINE_END:
+                break
+            result = work(item)
+            if outbox is not None and not _put(outbox, result, stop):
+                return
+        if outbox is not None:
+            _put(outbox, _PIPELINE_END, stop)
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+
 class IndonesianRAGPipeline:
-    def __init__(self, model_type: str = "qa", use_tqdm: bool = True):
+    def __init__(self, model_type: str = "qa", use_tqdm: bool = True, num_workers: Optional[int] = None):
         self.model_type = model_type
         self.use_tqdm = use_tqdm
         self.settings = settings
         
         # Update model type in settings
         self.settings.model_config.model_type = model_type
+        if num_workers is not None:
+            self.settings.data_config.num_workers = num_workers
         
         # Initialize components
-        self.data_loader = IndonesianTextLoader(use_tqdm=use_tqdm)
+        self.data_loader = IndonesianTextLoader(
+            use_tqdm=use_tqdm,
+            max_workers=settings.data_config.max_workers
+        )
         self.text_splitter = IndonesianTextSplitter(
             chunk_size=settings.data_config.chunk_size,
             chunk_overlap=settings.data_config.chunk_overlap,
-            use_tqdm=use_tqdm
-        )
-        self.embedding_model = IndonesianEmbeddingModel(
-            model_name=settings.model_config.embedding_model_name,
-            use_tqdm=use_tqdm
+            use_tqdm=use_tqdm,
+            num_workers=settings.data_config.num_workers,
+            align_sentences=settings.data_config.align_sentences
         )
         self.vector_store = VectorStore(use_tqdm=use_tqdm)
-        self.retriever = Retriever(self.embedding_model, self.vector_store)
-        self.generator = IndonesianGenerator(
-            model_config=settings.model_config,
-            use_tqdm=use_tqdm
-        )
         
-        app_logger.info(f"Indonesian RAG Pipeline initialized with {model_type} model")
+        # Model dimuat saat pertama kali dipakai: build index tidak butuh generator,
+        # dan cek status koleksi tidak butuh keduanya
+        self._embedding_model = None
+        self._embedding_cache = None
+        self._retriever = None
+        self._generator = None
+        
+        app_logger.info("Indonesian RAG Pipeline initialized with %s model", model_type)
+    
+    @property
+    def embedding_model(self) -> IndonesianEmbeddingModel:
+        if self._embedding_model is None:
+            self._embedding_model = IndonesianEmbeddingModel(
+                model_name=self.settings.model_config.embedding_model_name,
+                use_tqdm=self.use_tqdm,
+                precision=self.settings.model_config.embedding_precision,
+                compile=self.settings.model_config.compile_embedding_model,
+                num_threads=self.settings.model_config.embedding_num_threads
+            )
+        return self._embedding_model
+    
+    @property
+    def embedding_cache(self) -> Optional[EmbeddingCache]:
+        if self._embedding_cache is None and self.settings.data_config.use_embedding_cache:
+            self._embedding_cache = EmbeddingCache(
+                self.settings.get_embedding_cache_path(),
+                dim=self.embedding_model.dimension,
+                # Precision ikut jadi namespace karena mengubah nilai embedding
+                model_name=f"{self.embedding_model.model_name}@{self.embedding_model.precision}"
+            )
+        return self._embedding_cache
     
-    def build_index(self, data_directory: str) -> bool:
-        """Build the search index from documents"""
-        app_logger.info(f"Building index from data directory: {data_directory}")
+    @property
+    def retriever(self) -> Retriever:
+        if self._retriever is None:
+            self._retriever = Retriever(
+                self.embedding_model,
+                self.vector_store,
+                cache_size=self.settings.data_config.query_cache_size,
+                profile=self.settings.data_config.search_profile,
+                ef_search=self.settings.data_config.ef_search
+            )
+        return self._retriever
+    
+    @property
+    def generator(self) -> IndonesianGenerator:
+        if self._generator is None:
+            self._generator = IndonesianGenerator(
+                model_config=self.settings.model_config,
+                use_tqdm=self.use_tqdm
+            )
+        return self._generator
+    
+    def build_index(self, data_directory: str, recreate_outdated: bool = False) -> bool:
+        """Build the search index from documents
+        
+        Koleksi berlayout lama hanya dihapus dan dibangun ulang jika recreate_outdated.
+        """
+        app_logger.info("Building index from data directory: %s", data_directory)
         
         try:
             # PERBAIKAN: Cek apakah data directory ada
@@ -59,21 +151,12 @@ class IndonesianRAGPipeline:
                 app_logger.error("No documents loaded. Exiting.")
                 return False
             
-            # Split documents into chunks
-            chunks = self.text_splitter.split_documents(documents)
-            if not chunks:
+            # Split -> encode -> simpan berjalan bersamaan per batch chunk
+            chunk_count = self._run_index_pipeline(documents, recreate_outdated)
+            if not chunk_count:
                 app_logger.error("No chunks created. Exiting.")
                 return False
             
-            # Generate embeddings
-            texts = [chunk['content'] for chunk in chunks]
-            embeddings = self.embedding_model.encode(texts)
-            
-            # PERBAIKAN: Tidak perlu panggil create_collection() lagi
-            # karena sudah dihandle di constructor VectorStore
-            # Store in vector database
-            self.vector_store.add_documents(chunks, embeddings)
-            
             app_logger.info("Successfully built search index")
             return True
             
@@ -81,6 +164,116 @@ class IndonesianRAGPipeline:
             app_logger.error(f"Error building index: {str(e)}")
             return False
     
+    def _run_index_pipeline(self, documents: List[Dict[str, Any]], recreate_outdated: bool = False) -> int:
+        """Tiga thread (split, encode, add) dihubungkan queue berukuran terbatas; kembalikan jumlah chunk"""
+        # Koleksi lama (space l2 / ID uuid) tidak bisa dicampur dengan embedding baru;
+        # menghapusnya membuang seluruh korpus yang sudah terindeks, jadi harus diminta
+        if not recreate_outdated and not self.vector_store.has_current_layout():
+            raise RuntimeError(
+                "Vector store collection uses an older layout; rebuild it with --recreate-outdated"
+            )
+        
+        # Model dan cache dimuat di thread utama, bukan di tengah pipeline
+        self.embedding_model
+        self.embedding_cache
+        
+        # Koleksi baru dihapus setelah model siap, agar gagal muat tidak mengosongkannya
+        if recreate_outdated:
+            self.vector_store.recreate_if_outdated()
+        
+        # First-load: seluruh korpus lewat jalur bulk (koleksi dengan batch HNSW besar,
+        # insert per max batch); update berikutnya tetap incremental
+        bulk = self.vector_store.begin_bulk_load()
+        chunk_batch_size = max(PIPELINE_CHUNK_BATCH, self.vector_store.max_batch_size()) if bulk \
+            else PIPELINE_CHUNK_BATCH
+        chunks_q = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        embeddings_q = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        stop = threading.Event()
+        errors = []
+        stored = [0]
+        
+        def split_stage():
+            batches = self.text_splitter.iter_chunk_batches(documents, chunk_batch_size)
+            try:
+                for chunks in batches:
+                    if not _put(chunks_q, chunks, stop):
+                        return
+                _put(chunks_q, _PIPELINE_END, stop)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                batches.close()
+        
+        def encode(chunks):
+            # Koleksi memakai inner product, jadi embedding harus ternormalisasi L2
+            return chunks, l2_normalize(self._encode_chunks(chunks.contents))
+        
+        add_batch = self.vector_store.add_bulk if bulk else self.vector_store.add_documents
+        
+        def store(item):
+            chunks, embeddings = item
+            add_batch(chunks, embeddings)
+            stored[0] += len(chunks)
+        
+        threads = [
+            threading.Thread(target=split_stage, name="index-split"),
+            threading.Thread(target=_consume, args=(chunks_q, encode, embeddings_q, stop, errors),
+                             name="index-encode"),
+            threading.Thread(target=_consume, args=(embeddings_q, store, None, stop, errors),
+                             name="index-store"),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        if errors:
+            raise errors[0]
+        return stored[0]
+    
+    def _encode_chunks(self, texts: List[str]) -> np.ndarray:
+        """Encode setiap teks unik sekali saja, lalu sebar hasilnya ke urutan texts"""
+        hashes = [EmbeddingCache.hash_text(text) for text in texts]
+        
+        # Chunk duplikat (header, footer, disclaimer) dipetakan ke baris unik pertamanya
+        unique_index: Dict[str, int] = {}
+        unique_texts = []
+        inverse = np.empty(len(texts), dtype=np.intp)
+        for i, (text_hash, text) in enumerate(zip(hashes, texts)):
+            j = unique_index.get(text_hash)
+            if j is None:
+                j = unique_index[text_hash] = len(unique_texts)
+                unique_texts.append(text)
+            inverse[i] = j
+        app_logger.info("Deduplicated %d chunks to %d unique texts", len(texts), len(unique_texts))
+        
+        unique_embeddings = self._encode_with_cache(list(unique_index), unique_texts)
+        return unique_embeddings[inverse]
+    
+    def _encode_with_cache(self, hashes: List[str], texts: List[str]) -> np.ndarray:
+        """Encode hanya teks (unik) yang belum ada di embedding cache, urutan hasil sama dengan texts"""
+        embedding_cache = self.embedding_cache
+        if embedding_cache is None:
+            return self.embedding_model.encode(texts)
+        
+        cached = embedding_cache.get_many(hashes)
+        embeddings = np.empty((len(texts), self.embedding_model.dimension), dtype=np.float32)
+        missing = []
+        for i, text_hash in enumerate(hashes):
+            vec = cached.get(text_hash)
+            if vec is None:
+                missing.append(i)
+            else:
+                embeddings[i] = vec
+        app_logger.info("Embedding cache: %d hits, %d to encode", len(texts) - len(missing), len(missing))
+        
+        if missing:
+            new_embeddings = self.embedding_model.encode([texts[i] for i in missing])
+            embedding_cache.put_many([hashes[i] for i in missing], new_embeddings)
+            embeddings[missing] = new_embeddings
+        return embeddings
+    
     def collection_exists(self) -> bool:
         """Check if collection exists and has documents"""
         try:
@@ -99,39 +292,60 @@ class IndonesianRAGPipeline:
     
     def query(self, question: str, n_results: int = 3) -> Dict[str, Any]:
         """Query the RAG system"""
-        app_logger.info(f"Processing query: {question}")
+        return self.query_many([question], n_results=n_results)[0]
+    
+    def query_many(self, questions: List[str], n_results: int = 3) -> List[Dict[str, Any]]:
+        """Query banyak pertanyaan; retrieval dilakukan dalam satu batch"""
+        app_logger.info("Processing %d queries: %s", len(questions), questions)
         
         try:
             # Retrieve relevant documents
-            relevant_docs = self.retriever.retrieve(question, n_results=n_results)
-            
-            if not relevant_docs:
-                return {
-                    "answer": "Maaf, tidak dapat menemukan informasi yang relevan untuk pertanyaan Anda.",
-                    "confidence": 0.0,
-                    "sources": []
-                }
-            
-            # Generate response
-            response = self.generator.generate(question, relevant_docs)
-            return response
-            
+            relevant_docs_per_question = self.retriever.retrieve_many(questions, n_results=n_results)
         except Exception as e:
             app_logger.error(f"Error processing query: {str(e)}")
-            return {
-                "answer": "Maaf, terjadi kesalahan dalam memproses pertanyaan Anda.",
-                "confidence": 0.0,
-                "sources": []
-            }
+            return [self._error_response() for _ in questions]
+        
+        responses = []
+        for question, relevant_docs in zip(questions, relevant_docs_per_question):
+            try:
+                if not relevant_docs:
+                    responses.append({
+                        "answer": "Maaf, tidak dapat menemukan informasi yang relevan untuk pertanyaan Anda.",
+                        "confidence": 0.0,
+                        "sources": []
+                    })
+                    continue
+                
+                # Generate response
+                responses.append(self.generator.generate(question, relevant_docs))
+                
+            except Exception as e:
+                app_logger.error(f"Error processing query: {str(e)}")
+                responses.append(self._error_response())
+        
+        return responses
+    
+    def _error_response(self) -> Dict[str, Any]:
+        return {
+            "answer": "Maaf, terjadi kesalahan dalam memproses pertanyaan Anda.",
+            "confidence": 0.0,
+            "sources": []
+        }
 
 def main():
     parser = argparse.ArgumentParser(description="Indonesian RAG System")
     parser.add_argument("--data-dir", type=str, help="Directory containing Indonesian text documents")
-    parser.add_argument("--query", type=str, help="Query to process")
+    parser.add_argument("--query", type=str, action="append",
+                       help="Query to process (can be given multiple times, queries are retrieved in one batch)")
     parser.add_argument("--model-type", choices=["qa", "generative"], default="qa", 
                        help="Model type: 'qa' for question-answering, 'generative' for text generation")
     parser.add_argument("--no-tqdm", action="store_true", help="Disable tqdm progress bars")
     parser.add_argument("--interactive", action="store_true", help="Run in interactive mode")
+    parser.add_argument("--num-workers", type=int, default=None,
+                       help="Number of processes for splitting documents (1 = serial, default: CPU count - 1)")
+    parser.add_argument("--recreate-outdated", action="store_true",
+                       help="Delete and rebuild a vector store collection with the old layout "
+                            "(drops every indexed document)")
     
     args = parser.parse_args()
     
@@ -140,12 +354,16 @@ def main():
     # Setup logging
     setup_logger("indonesian_rag", "logs/application.log", "INFO")
     
-    rag_pipeline = IndonesianRAGPipeline(model_type=args.model_type, use_tqdm=use_tqdm)
+    rag_pipeline = IndonesianRAGPipeline(
+        model_type=args.model_type,
+        use_tqdm=use_tqdm,
+        num_workers=args.num_workers
+    )
     
     # Build index jika data directory diberikan
     if args.data_dir:
         print(f"📦 Building index from: {args.data_dir}")
-        success = rag_pipeline.build_index(args.data_dir)
+        success = rag_pipeline.build_index(args.data_dir, recreate_outdated=args.recreate_outdated)
         if not success:
             print("❌ Failed to build index")
             sys.exit(1)
@@ -153,19 +371,22 @@ def main():
             doc_count = rag_pipeline.get_document_count()
             print(f"✅ Successfully built index with {doc_count} documents")
     
-    # Process single query
+    # Process queries (semua --query di-retrieve dalam satu batch)
     if args.query:
-        print(f"❓ Processing query: {args.query}")
-        response = rag_pipeline.query(args.query)
-        print(f"\nPertanyaan: {args.query}")
-        print(f"Jawaban: {response['answer']}")
-        print(f"Confidence: {response['confidence']:.3f}")
-        
-        if response['sources']:
-            print("\n📚 Sumber referensi:")
-            for i, source in enumerate(response['sources'], 1):
-                print(f"  {i}. {source['source']}")
-                print(f"     Preview: {source['content_preview']}")
+        for query in args.query:
+            print(f"❓ Processing query: {query}")
+        responses = rag_pipeline.query_many(args.query)
+        
+        for query, response in zip(args.query, responses):
+            print(f"\nPertanyaan: {query}")
+            print(f"Jawaban: {response['answer']}")
+            print(f"Confidence: {response['confidence']:.3f}")
+            
+            if response['sources']:
+                print("\n📚 Sumber referensi:")
+                for i, source in enumerate(response['sources'], 1):
+                    print(f"  {i}. {source['source']}")
+                    print(f"     Preview: {source['content_preview']}")
     
     # Interactive mode
     if args.interactive or (not args.data_dir and not args.query):
@@ -0,0 +1,70 @@
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Dict
+
+import numpy as np
+
+from src.utils.logger import app_logger
+
+# Batas jumlah parameter per query "IN (...)" (aman untuk SQLite lama)
+_LOOKUP_CHUNK = 500
+
+class EmbeddingCache:
+    """Cache embedding on-disk (SQLite) berkunci SHA-256 teks, dipisah per model"""
+    
+    def __init__(self, path: str, dim: int, model_name: str):
+        self.path = path
+        self.dim = dim
+        self.model_name = model_name
+        
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS emb ("
+                "model TEXT NOT NULL, hash TEXT NOT NULL, vec BLOB NOT NULL, "
+                "PRIMARY KEY (model, hash))"
+            )
+        
+        app_logger.info(f"Embedding cache opened at {path} for {model_name}")
+    
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    
+    def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Ambil embedding yang sudah ada di cache; hash yang tidak ada diabaikan"""
+        found = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        
+        with self._lock:
+            for i in range(0, len(unique_hashes), _LOOKUP_CHUNK):
+                batch = unique_hashes[i:i + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, vec FROM emb WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model_name, *batch]
+                )
+                for text_hash, blob in rows:
+                    vec = np.frombuffer(blob, dtype=np.float32)
+                    # Abaikan entri dengan dimensi berbeda (mis. cache lama yang rusak)
+                    if vec.shape[0] == self.dim:
+                        found[text_hash] = vec
+        
+        return found
+    
+    def put_many(self, hashes: List[str], embeddings: np.ndarray):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        rows = [(self.model_name, h, embeddings[i].tobytes()) for i, h in enumerate(hashes)]
+        
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO emb (model, hash, vec) VALUES (?, ?, ?)", rows
+            )
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
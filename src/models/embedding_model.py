@@ -1,28 +1,235 @@
+import contextlib
+import os
+import time
 import numpy as np
-from typing import List
-from sentence_transformers import SentenceTransformer
-import torch
+from typing import List, Optional
 
 from src.utils.logger import app_logger
 from src.utils.progress_bar import ProgressBar
 
+# "auto" = fp16 di CUDA, fp32 di CPU. int8 (dynamic quantization) hanya untuk CPU.
+PRECISIONS = ("auto", "fp32", "fp16", "bf16", "int8")
+
+# Jumlah batch per window encode: satu panggilan tokenizer per window, lalu
+# baris di window diurutkan menurut panjang token (lihat _encode_window)
+ENCODE_WINDOW_BATCHES = 32
+
+# Batas probing batch size otomatis (lihat _probe_batch_size)
+DEFAULT_BATCH_SIZE = 32
+MAX_PROBE_BATCH_SIZE = 512
+CPU_BATCH_SIZE_RANGE = (8, 64)
+
+def l2_normalize(embeddings: np.ndarray) -> np.ndarray:
+    """Normalisasi L2 per baris; array yang sudah ternormalisasi dikembalikan apa adanya"""
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    if np.allclose(norms, 1.0, atol=1e-3):
+        return embeddings
+    return embeddings / np.maximum(norms, 1e-12)
+
+def _physical_cpu_count() -> int:
+    """Jumlah core fisik (psutil jika terpasang), dibatasi core yang boleh dipakai proses"""
+    try:
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:
+        available = os.cpu_count() or 1
+    
+    try:
+        import psutil
+        physical = psutil.cpu_count(logical=False)
+    except ImportError:
+        physical = None
+    
+    return max(1, min(available, physical or available))
+
 class IndonesianEmbeddingModel:
     def __init__(self, model_name: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2", 
-                 device: str = None, use_tqdm: bool = True):
+                 device: str = None, use_tqdm: bool = True, precision: str = "auto",
+                 compile: bool = False, num_threads: Optional[int] = None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unsupported precision: {precision}")
+        
+        # torch dan sentence-transformers di-import di sini agar modul ini (dan
+        # l2_normalize) ringan untuk di-import, mis. untuk `--help`
+        import torch
+        from sentence_transformers import SentenceTransformer
+        
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.use_tqdm = use_tqdm
         
-        app_logger.info(f"Loading embedding model: {model_name} on {self.device}")
+        # Pengaturan thread torch berlaku untuk seluruh proses (termasuk generator),
+        # jadi hanya diubah jika pemanggil memintanya
+        if self.device == "cpu" and num_threads is not None:
+            self._configure_cpu_threads(num_threads)
+        
+        app_logger.info("Loading embedding model: %s on %s", model_name, self.device)
         
         try:
             self.model = SentenceTransformer(model_name, device=self.device)
-            app_logger.info(f"Successfully loaded embedding model: {model_name}")
+            self.model_name = model_name
+            self.dimension = self.model.get_sentence_embedding_dimension()
+            app_logger.info("Successfully loaded embedding model: %s", model_name)
         except Exception as e:
             app_logger.error(f"Error loading model {model_name}: {str(e)}")
             raise
+        
+        self.precision = self._apply_precision(precision)
+        app_logger.info("Embedding model precision: %s", self.precision)
+        
+        # Diisi saat encode pertama dengan batch_size=None
+        self._optimal_bs: Optional[int] = None
+        
+        self.compiled = compile and self._compile_model()
+    
+    def _configure_cpu_threads(self, num_threads: int):
+        """Set thread intra-op torch (0 = jumlah core fisik) dan satu thread inter-op"""
+        import torch
+        
+        torch.set_num_threads(num_threads or _physical_cpu_count())
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Hanya bisa diset sebelum ada kerja inter-op pertama di proses ini
+            pass
+        app_logger.info("CPU encode uses %d intra-op threads", torch.get_num_threads())
+    
+    def _compile_model(self) -> bool:
+        """torch.compile transformer di dalam SentenceTransformer, lalu warm-up sekali"""
+        if self.precision == "int8":
+            app_logger.warning("torch.compile is not applied to int8 quantized models")
+            return False
+        
+        import torch
+        
+        # SentenceTransformer.encode memanggil forward() langsung, sehingga yang
+        # di-compile adalah model HF di modul pertama
+        transformer = self.model[0]
+        eager_model = transformer.auto_model
+        try:
+            transformer.auto_model = torch.compile(eager_model, dynamic=True)
+            
+            # Warm-up agar query pertama tidak menanggung biaya kompilasi
+            self.encode(["warm-up"], batch_size=1)
+            app_logger.info("Embedding model compiled with torch.compile")
+            return True
+        except Exception as e:
+            transformer.auto_model = eager_model
+            app_logger.warning(f"torch.compile failed, using eager mode: {str(e)}")
+            return False
+    
+    def _apply_precision(self, precision: str) -> str:
+        """Konversi bobot model sesuai precision dan device, kembalikan precision efektif"""
+        import torch
+        
+        on_cuda = self.device.startswith("cuda")
+        
+        if precision == "auto":
+            precision = "fp16" if on_cuda else "fp32"
+        elif precision == "fp16" and not on_cuda:
+            app_logger.warning("fp16 is only supported on CUDA, using fp32")
+            precision = "fp32"
+        elif precision == "int8" and on_cuda:
+            app_logger.warning("int8 dynamic quantization is only supported on CPU, using fp32")
+            precision = "fp32"
+        
+        if precision == "fp16":
+            self.model.half()
+        elif precision == "bf16":
+            self.model.to(torch.bfloat16)
+        elif precision == "int8":
+            self.model = torch.ao.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        
+        return precision
+    
+    def _autocast(self):
+        import torch
+        
+        dtype = {"fp16": torch.float16, "bf16": torch.bfloat16}.get(self.precision)
+        if dtype is None:
+            return contextlib.nullcontext()
+        device_type = "cuda" if self.device.startswith("cuda") else "cpu"
+        return torch.autocast(device_type, dtype=dtype)
+    
+    def _probe_batch_size(self, texts: List[str]) -> int:
+        """Pilih batch size dari memori yang tersedia; hasilnya disimpan di self._optimal_bs"""
+        if self._optimal_bs is not None:
+            return self._optimal_bs
+        
+        if self.device.startswith("cuda"):
+            self._optimal_bs = self._probe_cuda_batch_size(texts)
+        else:
+            self._optimal_bs = self._cpu_batch_size()
+        
+        app_logger.info("Auto-tuned embedding batch_size=%d", self._optimal_bs)
+        return self._optimal_bs
     
-    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
-        app_logger.info(f"Encoding {len(texts)} texts with batch_size={batch_size}")
+    def _probe_cuda_batch_size(self, texts: List[str]) -> int:
+        """Gandakan batch size selama latency per sampel masih turun; mundur saat OOM"""
+        import torch
+        
+        if not texts:
+            return DEFAULT_BATCH_SIZE
+        
+        # Teks terpanjang dari awal korpus sebagai sampel kasus terburuk
+        sample = max(texts[:256], key=len)
+        best_bs, best_latency = None, float("inf")
+        batch_size = DEFAULT_BATCH_SIZE
+        
+        with torch.inference_mode(), self._autocast():
+            while batch_size <= MAX_PROBE_BATCH_SIZE:
+                try:
+                    torch.cuda.synchronize()
+                    start = time.perf_counter()
+                    self.model.encode(
+                        [sample] * batch_size,
+                        batch_size=batch_size,
+                        convert_to_tensor=True,
+                        show_progress_bar=False,
+                        device=self.device
+                    )
+                    torch.cuda.synchronize()
+                    latency = (time.perf_counter() - start) / batch_size
+                except torch.cuda.OutOfMemoryError:
+                    torch.cuda.empty_cache()
+                    if best_bs is None and batch_size > 1:
+                        batch_size //= 2
+                        continue
+                    break
+                
+                if best_bs is not None and latency >= best_latency * 0.95:
+                    break
+                best_bs, best_latency = batch_size, latency
+                batch_size *= 2
+        
+        return best_bs or 1
+    
+    def _cpu_batch_size(self) -> int:
+        """Heuristik CPU dari RAM yang tersedia; psutil dipakai jika terpasang"""
+        try:
+            import psutil
+            available = psutil.virtual_memory().available
+        except ImportError:
+            try:
+                available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+            except (AttributeError, ValueError, OSError):
+                return DEFAULT_BATCH_SIZE
+        
+        seq_len = getattr(self.model, "max_seq_length", None) or 128
+        low, high = CPU_BATCH_SIZE_RANGE
+        return min(high, max(low, available // (4 * self.dimension * seq_len * 4)))
+    
+    def encode(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        import torch
+        
+        if batch_size is None:
+            batch_size = self._probe_batch_size(texts)
+        
+        app_logger.info("Encoding %d texts with batch_size=%d", len(texts), batch_size)
+        
+        # Output dialokasikan sekali; tiap window ditulis langsung dari tensor model
+        out = np.empty((len(texts), self.dimension), dtype=np.float32)
+        window = batch_size * ENCODE_WINDOW_BATCHES
         
         progress_bar = ProgressBar(
             total=len(texts), 
@@ -30,25 +237,93 @@ class IndonesianEmbeddingModel:
             use_tqdm=self.use_tqdm
         )
         
-        all_embeddings = []
+        try:
+            with torch.inference_mode(), self._autocast():
+                for i in range(0, len(texts), window):
+                    batch = texts[i:i + window]
+                    self._encode_window(batch, batch_size, out[i:i + len(batch)])
+                    
+                    progress_bar.update(len(batch), postfix={
+                        "completed": i + len(batch),
+                        "embedding_dim": self.dimension
+                    })
+        except Exception as e:
+            app_logger.error(f"Error encoding texts: {str(e)}")
+            raise
+        finally:
+            progress_bar.close()
         
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            
-            try:
-                with torch.no_grad():
-                    batch_embeddings = self.model.encode(batch, convert_to_tensor=True)
-                    all_embeddings.extend(batch_embeddings.cpu().numpy())
-                
-                progress_bar.update(len(batch), postfix={
-                    "completed": min(i + batch_size, len(texts)),
-                    "embedding_dim": batch_embeddings.shape[1]
-                })
-                
-            except Exception as e:
-                app_logger.error(f"Error encoding batch {i//batch_size}: {str(e)}")
-                progress_bar.update(len(batch))
+        app_logger.info("Successfully generated embeddings for %d texts", len(texts))
+        return out
+    
+    def _transformer_module(self):
+        """Modul pertama jika berupa Transformer sentence-transformers (tokenizer HF), selain itu None"""
+        try:
+            from sentence_transformers.sentence_transformer.modules import Transformer
+        except ImportError:
+            from sentence_transformers.models import Transformer
+        
+        module = self.model[0] if len(self.model) else None
+        return module if isinstance(module, Transformer) else None
+    
+    def _encode_window(self, texts: List[str], batch_size: int, out: np.ndarray):
+        """Tokenisasi satu window sekaligus, lalu forward per batch yang panjangnya mirip"""
+        import torch
         
-        progress_bar.close()
-        app_logger.info(f"Successfully generated embeddings for {len(all_embeddings)} texts")
-        return np.array(all_embeddings)
\ No newline at end of file
+        transformer = self._transformer_module()
+        if transformer is None:
+            # Model tanpa modul Transformer HF (mis. StaticEmbedding): serahkan ke SentenceTransformer.encode
+            embeddings = self.model.encode(
+                texts,
+                batch_size=batch_size,
+                convert_to_tensor=True,
+                show_progress_bar=False,
+                normalize_embeddings=True,
+                device=self.device
+            )
+            torch.from_numpy(out).copy_(embeddings)
+            return
+        
+        # Praproses sama dengan Transformer.tokenize: strip, lalu lowercase jika do_lower_case
+        texts = [str(text).strip() for text in texts]
+        if getattr(transformer, "do_lower_case", False):
+            texts = [text.lower() for text in texts]
+        
+        # Satu panggilan tokenizer untuk seluruh window (fast tokenizer memproses paralel)
+        tokenizer = transformer.tokenizer
+        encoded = tokenizer(
+            texts,
+            padding=False,
+            truncation=True,
+            max_length=self.model.max_seq_length,
+            return_attention_mask=False
+        )
+        lengths = np.fromiter((len(ids) for ids in encoded["input_ids"]), dtype=np.int64, count=len(texts))
+        # Length bucketing: terpanjang dulu, sehingga padding per batch minim
+        order = np.argsort(-lengths, kind="stable")
+        pad_left = tokenizer.padding_side == "left"
+        
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            width = int(lengths[idx].max())
+            
+            features = {
+                "input_ids": np.full((len(idx), width), tokenizer.pad_token_id or 0, dtype=np.int64),
+                "attention_mask": np.zeros((len(idx), width), dtype=np.int64)
+            }
+            if "token_type_ids" in encoded:
+                features["token_type_ids"] = np.zeros((len(idx), width), dtype=np.int64)
+            
+            for row, j in enumerate(idx):
+                n = lengths[j]
+                cols = slice(width - n, width) if pad_left else slice(0, n)
+                features["input_ids"][row, cols] = encoded["input_ids"][j]
+                features["attention_mask"][row, cols] = 1
+                if "token_type_ids" in features:
+                    features["token_type_ids"][row, cols] = encoded["token_type_ids"][j]
+            
+            features = {key: torch.from_numpy(value).to(self.device) for key, value in features.items()}
+            embeddings = self.model(features)["sentence_embedding"]
+            embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+            # Kembalikan ke urutan asli saat ditulis ke output
+            out[idx] = embeddings.float().cpu().numpy()
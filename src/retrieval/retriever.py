@@ -1,17 +1,44 @@
-from typing import List, Dict, Any
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+import logging
+import threading
 import numpy as np
 
 from src.models.embedding_model import IndonesianEmbeddingModel
 from src.data.vector_store import VectorStore
 from src.utils.logger import app_logger
 
+# Batch size saat meng-encode query yang belum ada di cache
+QUERY_BATCH_SIZE = 64
+
+# Profil pencarian: hnsw ef_search. "balanced" = default Chroma (100)
+SEARCH_PROFILES = {
+    "fast": 16,
+    "balanced": 100,
+    "recall": 256
+}
+
 class Retriever:
-    def __init__(self, embedding_model: IndonesianEmbeddingModel, vector_store: VectorStore):
+    def __init__(self, embedding_model: IndonesianEmbeddingModel, vector_store: VectorStore,
+                 cache_size: int = 1024, profile: str = "balanced", ef_search: Optional[int] = None):
+        if profile not in SEARCH_PROFILES:
+            raise ValueError(f"Unknown search profile: {profile}")
+        
         self.embedding_model = embedding_model
         self.vector_store = vector_store
+        self.profile = profile
+        self.ef_search = ef_search or SEARCH_PROFILES[profile]
+        
+        # LRU cache embedding query, dijaga lock karena CLI/Streamlit bisa memanggil bersamaan
+        self.cache_size = cache_size
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
         
         # Pastikan vector store siap digunakan
         self._ensure_retriever_ready()
+        self.vector_store.set_search_ef(self.ef_search)
         
         app_logger.info("Retriever initialized")
     
@@ -27,8 +54,64 @@ class Retriever:
             app_logger.error(f"Error preparing retriever: {str(e)}")
             raise
     
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embedding banyak query; yang belum ada di LRU cache di-encode dalam satu batch"""
+        # Kunci = query persis (hanya strip); tokenizer XLM-R case-sensitive sehingga
+        # "Apa itu AI" dan "apa itu ai" menghasilkan embedding berbeda
+        keys = [query.strip() for query in queries]
+        embeddings: Dict[str, np.ndarray] = {}
+        missing: List[str] = []
+        
+        with self._cache_lock:
+            for key in dict.fromkeys(keys):
+                embedding = self._query_cache.get(key)
+                if embedding is not None:
+                    self._query_cache.move_to_end(key)
+                    self._cache_hits += 1
+                    embeddings[key] = embedding
+                else:
+                    self._cache_misses += 1
+                    missing.append(key)
+        
+        if missing:
+            encoded = self.embedding_model.encode(missing, batch_size=QUERY_BATCH_SIZE)
+            embeddings.update(zip(missing, encoded))
+            
+            if self.cache_size > 0:
+                with self._cache_lock:
+                    for key in missing:
+                        self._query_cache[key] = embeddings[key]
+                        self._query_cache.move_to_end(key)
+                    while len(self._query_cache) > self.cache_size:
+                        self._query_cache.popitem(last=False)
+        
+        out = np.empty((len(keys), self.embedding_model.dimension), dtype=np.float32)
+        for i, key in enumerate(keys):
+            out[i] = embeddings[key]
+        return out
+    
+    def cache_info(self) -> Dict[str, int]:
+        """Statistik cache embedding query"""
+        with self._cache_lock:
+            return {
+                "hits": self._cache_hits,
+                "misses": self._cache_misses,
+                "maxsize": self.cache_size,
+                "currsize": len(self._query_cache)
+            }
+    
+    def clear_cache(self):
+        with self._cache_lock:
+            self._query_cache.clear()
+            self._cache_hits = 0
+            self._cache_misses = 0
+    
     def retrieve(self, query: str, n_results: int = 5) -> List[Dict[str, Any]]:
-        app_logger.info(f"Retrieving documents for query: '{query}'")
+        return self.retrieve_many([query], n_results=n_results)[0]
+    
+    def retrieve_many(self, queries: List[str], n_results: int = 5) -> List[List[Dict[str, Any]]]:
+        """Retrieve untuk banyak query: satu encode batch dan satu search batch"""
+        app_logger.info("Retrieving documents for %d queries: %r", len(queries), queries)
         
         try:
             # Pastikan collection tersedia
@@ -36,15 +119,19 @@ class Retriever:
                 app_logger.warning("Collection not found, reinitializing...")
                 self.vector_store._ensure_collection_initialized()
             
-            # Encode query
-            query_embedding = self.embedding_model.encode([query])[0]
+            # Encode queries; encode sudah mengembalikan baris ternormalisasi L2 untuk inner product
+            query_embeddings = self._embed_queries(queries)
             
             # Search vector store
-            results = self.vector_store.search(query_embedding.tolist(), n_results=n_results)
+            results = self.vector_store.search_batch(
+                query_embeddings.astype(np.float32, copy=False),
+                n_results=n_results
+            )
             
-            app_logger.info(f"Retrieved {len(results)} relevant documents")
+            if app_logger.isEnabledFor(logging.INFO):
+                app_logger.info("Retrieved %d relevant documents", sum(len(r) for r in results))
             return results
             
         except Exception as e:
             app_logger.error(f"Error during retrieval: {str(e)}")
-            return []
\ No newline at end of file
+            return [[] for _ in queries]
@@ -3,6 +3,9 @@ import time
 from typing import Optional, Dict, Any
 from src.utils.logger import app_logger
 
+# Tanpa tqdm, progress ditulis ke log paling banyak sekali per interval ini
+LOG_EVERY_PERCENT = 5
+
 class ProgressBar:
     def __init__(self, total: int, desc: str = "Processing", use_tqdm: bool = True):
         self.total = total
@@ -11,14 +14,21 @@ class ProgressBar:
         self.current = 0
         
         if self.use_tqdm:
+            # Render dibatasi waktu dan jumlah update agar tidak membebani terminal (mis. via SSH)
             self.pbar = tqdm(
                 total=total,
                 desc=desc,
                 unit="item",
-                bar_format='{l_bar}{bar:50}{r_bar}{bar:-50b}'
+                bar_format='{l_bar}{bar:50}{r_bar}{bar:-50b}',
+                mininterval=0.5,
+                maxinterval=2.0,
+                miniters=max(1, total // 200),
+                leave=False
             )
         else:
-            app_logger.info(f"Starting: {desc}")
+            self._log_step = max(1, total * LOG_EVERY_PERCENT // 100)
+            self._next_log = self._log_step
+            app_logger.info("Starting: %s", desc)
     
     def update(self, n: int = 1, postfix: Optional[Dict[str, Any]] = None):
         self.current += n
@@ -26,23 +36,25 @@ class ProgressBar:
         if self.use_tqdm:
             self.pbar.update(n)
             if postfix:
-                self.pbar.set_postfix(**postfix)
-        else:
-            progress_percent = (self.current / self.total) * 100
-            app_logger.info(f"Progress: {progress_percent:.1f}% - {self.current}/{self.total}")
+                # Postfix ikut tampil pada render berikutnya, tanpa flush sendiri
+                self.pbar.set_postfix(postfix, refresh=False)
+        elif self.current >= self._next_log or self.current >= self.total:
+            self._next_log = (self.current // self._log_step + 1) * self._log_step
+            progress_percent = (self.current / self.total) * 100 if self.total else 100.0
+            app_logger.info("Progress: %.1f%% - %d/%d", progress_percent, self.current, self.total)
             if postfix:
-                app_logger.info(f"Metrics: {postfix}")
+                app_logger.info("Metrics: %s", postfix)
     
     def set_description(self, desc: str):
         if self.use_tqdm:
             self.pbar.set_description(desc)
         else:
-            app_logger.info(f"Stage: {desc}")
+            app_logger.info("Stage: %s", desc)
     
     def close(self):
         if self.use_tqdm:
             self.pbar.close()
-        app_logger.info(f"Completed: {self.desc}")
+        app_logger.info("Completed: %s", self.desc)
 
 def track_operation(iterable, desc: str = "Processing", use_tqdm: bool = True):
     return ProgressBar(total=len(iterable), desc=desc, use_tqdm=use_tqdm)
\ No newline at end of file
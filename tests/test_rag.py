@@ -0,0 +1,308 @@
+import logging
+import math
+
+import numpy as np
+import pytest
+
+from src.data.text_splitter import IndonesianTextSplitter
+from src.models.embedding_cache import EmbeddingCache
+from src.retrieval.retriever import Retriever
+from src.utils.progress_bar import ProgressBar
+
+
+def _splitter(chunk_size, chunk_overlap, align_sentences=False):
+    return IndonesianTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                  use_tqdm=False, num_workers=1, align_sentences=align_sentences)
+
+
+def _token_ranges(chunks, tokens):
+    """(start, end) indeks token tiap chunk; token unik sehingga posisinya pasti"""
+    position = {token: i for i, token in enumerate(tokens)}
+    ranges = []
+    for chunk in chunks:
+        words = chunk.split()
+        ranges.append((position[words[0]], position[words[-1]] + 1))
+    return ranges
+
+
+@pytest.mark.parametrize("n_words, chunk_size, chunk_overlap", [
+    (1, 5, 1), (5, 5, 1), (6, 5, 1), (13, 5, 1), (100, 10, 3), (101, 10, 0), (37, 8, 7),
+])
+def test_create_chunks_count_follows_stride(n_words, chunk_size, chunk_overlap):
+    text = " ".join(f"w{i}" for i in range(n_words))
+    chunks = _splitter(chunk_size, chunk_overlap).create_chunks(text)
+
+    stride = chunk_size - chunk_overlap
+    expected = 1 if n_words <= chunk_size else math.ceil((n_words - chunk_size) / stride) + 1
+    assert len(chunks) == expected
+    assert all(len(chunk.split()) <= chunk_size for chunk in chunks)
+    assert chunks[-1].split()[-1] == f"w{n_words - 1}"
+
+
+def test_create_chunks_empty_text():
+    assert _splitter(5, 1).create_chunks("   \n ") == []
+
+
+def test_sentence_aligned_chunks_leave_no_gaps():
+    # Kalimat dengan panjang bervariasi agar snapping benar-benar menggeser window
+    tokens = []
+    for i in range(300):
+        tokens.append(f"w{i}." if i % 7 == 3 or i % 11 == 0 else f"w{i}")
+    chunks = _splitter(20, 5, align_sentences=True).create_chunks(" ".join(tokens))
+    ranges = _token_ranges(chunks, tokens)
+
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(tokens)
+    for (prev_start, prev_end), (start, _) in zip(ranges, ranges[1:]):
+        assert prev_start < start <= prev_end
+
+
+def test_snapped_window_starts_at_sentence_boundary():
+    splitter = _splitter(10, 2, align_sentences=True)
+    tokens = [f"w{i}." if i == 7 else f"w{i}" for i in range(30)]
+    starts = splitter._sentence_starts(tokens)
+
+    assert starts == [8]
+    # Stride 8 tepat di batas kalimat; posisi 9 ditarik mundur ke 8
+    assert splitter._snap_to_sentence(8, 0, 10, 8, starts) == 8
+    assert splitter._snap_to_sentence(9, 1, 11, 8, starts) == 8
+    # Batas di luar setengah stride tidak dipakai
+    assert splitter._snap_to_sentence(14, 6, 16, 8, starts) == 14
+
+
+def test_split_documents_expands_chunk_columns():
+    splitter = _splitter(5, 1)
+    docs = [
+        {"content": " ".join(["kata"] * n), "source": f"s{n}"}
+        for n in (3, 12, 0, 20)
+    ]
+    batch = splitter.split_documents(docs)
+
+    assert batch.sources == ["s3"] + ["s12"] * 3 + ["s20"] * 5
+    assert batch.chunk_ids.tolist() == [0, 0, 1, 2, 0, 1, 2, 3, 4]
+    assert batch.total_chunks.tolist() == [1, 3, 3, 3, 5, 5, 5, 5, 5]
+    assert batch.original_doc_size.tolist() == [14] + [59] * 3 + [99] * 5
+    assert len(batch) == len(batch.contents) == 9
+
+
+def test_iter_chunk_batches_keeps_documents_whole():
+    splitter = _splitter(5, 1)
+    docs = [{"content": " ".join(["kata"] * n), "source": f"s{i}"} for i, n in enumerate((12, 20, 7, 9))]
+    batches = list(splitter.iter_chunk_batches(docs, batch_size=4))
+
+    # Batch dilepas setelah dokumen yang membuatnya >= batch_size
+    assert [len(b) for b in batches] == [8, 4]
+    for batch in batches:
+        for source in set(batch.sources):
+            rows = [i for i, s in enumerate(batch.sources) if s == source]
+            assert batch.chunk_ids[rows].tolist() == list(range(batch.total_chunks[rows[0]]))
+
+
+def test_embedding_cache_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), dim=4, model_name="m@fp32")
+    texts = ["satu", "dua"]
+    hashes = [EmbeddingCache.hash_text(text) for text in texts]
+    vectors = np.arange(8, dtype=np.float32).reshape(2, 4)
+
+    assert cache.get_many(hashes) == {}
+    cache.put_many(hashes, vectors)
+    found = cache.get_many(hashes + [EmbeddingCache.hash_text("tiga")])
+
+    assert set(found) == set(hashes)
+    np.testing.assert_array_equal(found[hashes[1]], vectors[1])
+
+    # Namespace model lain tidak melihat entri ini
+    other = EmbeddingCache(str(tmp_path / "cache.sqlite3"), dim=4, model_name="m@fp16")
+    assert other.get_many(hashes) == {}
+    cache.close()
+    other.close()
+
+
+class _FakeEmbeddingModel:
+    dimension = 3
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size=None):
+        self.encoded.append(list(texts))
+        return np.array([[len(text), 1.0, 0.0] for text in texts], dtype=np.float32)
+
+
+class _FakeVectorStore:
+    collection = object()
+
+    def __init__(self):
+        self.ef = None
+
+    def set_search_ef(self, ef_search):
+        self.ef = ef_search
+
+
+def test_retriever_query_cache_is_lru_and_case_sensitive():
+    model = _FakeEmbeddingModel()
+    retriever = Retriever(model, _FakeVectorStore(), cache_size=2)
+
+    retriever._embed_queries(["Apa itu AI", " apa itu ai "])
+    assert model.encoded == [["Apa itu AI", "apa itu ai"]]
+
+    retriever._embed_queries(["Apa itu AI"])
+    assert retriever.cache_info()["hits"] == 1
+
+    # "apa itu ai" paling lama tidak dipakai, jadi dikeluarkan saat query ketiga masuk
+    retriever._embed_queries(["query baru"])
+    retriever._embed_queries(["apa itu ai"])
+    assert model.encoded[-1] == ["apa itu ai"]
+    assert retriever.cache_info()["currsize"] == 2
+
+
+def test_progress_bar_logs_at_most_every_five_percent(caplog):
+    with caplog.at_level(logging.INFO, logger="indonesian_rag"):
+        progress_bar = ProgressBar(total=1000, desc="test", use_tqdm=False)
+        for _ in range(1000):
+            progress_bar.update(1)
+        progress_bar.close()
+
+    progress_lines = [r.getMessage() for r in caplog.records if r.getMessage().startswith("Progress:")]
+    assert len(progress_lines) == 20
+    assert progress_lines[-1] == "Progress: 100.0% - 1000/1000"
+
+
+def _vector_store(tmp_path):
+    pytest.importorskip("chromadb")
+    from src.data.vector_store import VectorStore
+    return VectorStore(persist_directory=str(tmp_path / "vector_db"), use_tqdm=False)
+
+
+def _chunk_dicts(source, n, **extra):
+    return [{"content": f"{source} bagian {i}", "source": source, "chunk_id": i, **extra}
+            for i in range(n)]
+
+
+def _unit_vectors(n, dim=4):
+    vectors = np.random.default_rng(n).normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _stored_chunk_ids(store, source):
+    metadatas = store.collection.get(where={"source": source}, include=["metadatas"])["metadatas"]
+    return sorted(m["chunk_id"] for m in metadatas)
+
+
+def test_add_documents_upserts_and_prunes_stale_chunks(tmp_path):
+    store = _vector_store(tmp_path)
+    store.add_documents(_chunk_dicts("a.txt", 10, total_chunks=10), _unit_vectors(10))
+    store.add_documents(_chunk_dicts("b.txt", 2, total_chunks=2), _unit_vectors(2))
+
+    # Dokumen yang sama, kini lebih pendek: chunk 0..5 ditimpa, 6..9 dihapus
+    shorter = _chunk_dicts("a.txt", 6, total_chunks=6)
+    for chunk in shorter:
+        chunk["content"] += " (baru)"
+    store.add_documents(shorter, _unit_vectors(6))
+
+    assert _stored_chunk_ids(store, "a.txt") == list(range(6))
+    assert _stored_chunk_ids(store, "b.txt") == [0, 1]
+    documents = store.collection.get(where={"source": "a.txt"})["documents"]
+    assert all(doc.endswith("(baru)") for doc in documents)
+
+
+def test_add_documents_without_total_chunks_does_not_prune(tmp_path):
+    store = _vector_store(tmp_path)
+    store.add_documents(_chunk_dicts("a.txt", 3), _unit_vectors(3))
+
+    assert _stored_chunk_ids(store, "a.txt") == [0, 1, 2]
+
+
+def test_add_documents_numbers_chunks_without_chunk_id(tmp_path):
+    store = _vector_store(tmp_path)
+    chunks = [{"content": f"bagian {i}", "source": "a.txt"} for i in range(3)]
+    store.add_documents(chunks, _unit_vectors(3))
+
+    assert _stored_chunk_ids(store, "a.txt") == [0, 1, 2]
+
+
+def test_add_documents_rejects_duplicate_chunk_ids(tmp_path):
+    store = _vector_store(tmp_path)
+    chunks = _chunk_dicts("a.txt", 2) + _chunk_dicts("a.txt", 1)
+
+    with pytest.raises(ValueError):
+        store.add_documents(chunks, _unit_vectors(3))
+    assert store.collection.count() == 0
+
+
+def test_bulk_build_only_recreates_an_empty_collection(tmp_path):
+    store = _vector_store(tmp_path)
+    store.bulk_build(_chunk_dicts("a.txt", 5, total_chunks=5), _unit_vectors(5))
+    assert store.collection.count() == 5
+
+    # Koleksi sudah berisi: bulk_build jatuh ke add_documents, data lama tetap ada
+    store.bulk_build(_chunk_dicts("b.txt", 2, total_chunks=2), _unit_vectors(2))
+    assert _stored_chunk_ids(store, "a.txt") == list(range(5))
+    assert store.collection.count() == 7
+
+
+def test_layout_marker_survives_missing_space(tmp_path):
+    store = _vector_store(tmp_path)
+    store.set_search_ef(64)
+    assert store.has_current_layout()
+
+    # Koleksi baseline: space l2 bawaan dan ID uuid, tanpa penanda layout
+    store.client.delete_collection("indonesian_documents")
+    store.collection = store.client.create_collection(
+        name="indonesian_documents", metadata={"description": "Indonesian documents for RAG system"})
+    store.collection.add(ids=["0b5e4b1e-uuid"], embeddings=[[1.0, 0.0, 0.0, 0.0]],
+                         metadatas=[{"source": "a.txt", "chunk_id": 0}])
+    assert not store.has_current_layout()
+
+    # Penanda layout cukup, walau hnsw:space hilang dari metadata (modify di Chroma lama)
+    store.client.delete_collection("indonesian_documents")
+    store.collection = store.client.create_collection(
+        name="indonesian_documents", metadata={"layout": "ip-stable-id"})
+    assert store.has_current_layout()
+
+
+def _save_tiny_sentence_transformer(path, do_lower_case=False):
+    """Model BERT acak kecil + WordPiece lokal, agar tes tidak butuh unduhan
+    
+    Dengan do_lower_case, lowercase dilakukan modul Transformer, bukan tokenizer.
+    """
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    words = sorted({w for text in _ENCODE_TEXTS for w in text.lower().replace(".", " . ").split()})
+    vocab_file = path / "vocab.txt"
+    vocab_file.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *words]))
+
+    hf_dir = path / "hf"
+    config = BertConfig(vocab_size=5 + len(words), hidden_size=32, num_hidden_layers=2,
+                        num_attention_heads=2, intermediate_size=64, max_position_embeddings=128)
+    BertModel(config).save_pretrained(hf_dir)
+    BertTokenizerFast(vocab_file=str(vocab_file), do_lower_case=not do_lower_case).save_pretrained(hf_dir)
+
+    transformer = models.Transformer(str(hf_dir), max_seq_length=64, do_lower_case=do_lower_case)
+    pooling = models.Pooling(transformer.get_word_embedding_dimension(), pooling_mode="mean")
+    SentenceTransformer(modules=[transformer, pooling], device="cpu").save(str(path / "st"))
+    return str(path / "st")
+
+
+# Panjang bervariasi agar length bucketing, padding dan truncation ikut teruji
+_ENCODE_TEXTS = [
+    "Halo.", "Ibu kota Indonesia adalah Jakarta.", "Kecerdasan buatan " * 40, "AI",
+    "Sejarah Indonesia mencakup masa kerajaan Hindu Buddha.",
+    # Spasi di tepi harus di-strip seperti Transformer.tokenize
+    "  Halo Jakarta.\n", "\tAI  ",
+]
+
+
+@pytest.mark.parametrize("do_lower_case", [False, True])
+def test_encode_matches_sentence_transformers(tmp_path, do_lower_case):
+    pytest.importorskip("torch")
+    pytest.importorskip("sentence_transformers")
+    from src.models.embedding_model import IndonesianEmbeddingModel
+
+    model = IndonesianEmbeddingModel(_save_tiny_sentence_transformer(tmp_path, do_lower_case),
+                                     device="cpu", use_tqdm=False, precision="fp32")
+    expected = model.model.encode(_ENCODE_TEXTS, batch_size=2, convert_to_numpy=True,
+                                  normalize_embeddings=True)
+
+    np.testing.assert_allclose(model.encode(_ENCODE_TEXTS, batch_size=2), expected, atol=1e-5)